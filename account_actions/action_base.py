@@ -1,15 +1,25 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import datetime as dt
 import inspect
 
+from asgiref.sync import sync_to_async
+from django.core import mail
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext_lazy as _
 import six
 
+from .conf import settings as account_actions_settings
 from .core.compat import with_metaclass
 
 
+EXECUTION_MODE_INLINE = 'inline'
+EXECUTION_MODE_ON_COMMIT = 'on_commit'
+EXECUTION_MODE_BACKGROUND = 'background'
+EXECUTION_MODES = (EXECUTION_MODE_INLINE, EXECUTION_MODE_ON_COMMIT, EXECUTION_MODE_BACKGROUND, )
+
+
 class AccountActionMetaclass(type):
     """
     Ensures the AccountActionBase subclasses have the required values and proceed to some
@@ -35,6 +45,10 @@ class AccountActionMetaclass(type):
                 not (inspect.ismethod(execute_method) or inspect.isfunction(execute_method)):
             raise ImproperlyConfigured('The "execute" method must be configured')
 
+        if new_action.execution_mode not in EXECUTION_MODES:
+            raise ImproperlyConfigured(
+                'The "execution_mode" attribute must be one of {}'.format(EXECUTION_MODES))
+
         return new_action
 
 
@@ -54,6 +68,27 @@ class AccountActionBase(with_metaclass(AccountActionMetaclass, object)):
     landing_page_template_name = None
     title = None
 
+    # The number of days during which the tokens of the action can be consumed. The
+    # ACCOUNT_ACTION_TOKEN_VALIDITY_DURATION setting is used if this value is not set.
+    validity_duration = None
+
+    # Defines when the "execute" method is called once a token is consumed:
+    # - 'inline': immediately, while the token is saved
+    # - 'on_commit': once the transaction in which the token was consumed is committed
+    # - 'background': by the process_account_action_executions management command, using a
+    #   database queue (failing executions are retried)
+    execution_mode = EXECUTION_MODE_INLINE
+
+    def execute_many(self, tokens):
+        """
+        Executes the action for many consumed tokens at once (eg. when tokens are consumed using
+        AccountActionToken.objects.consume_many).
+        The default implementation calls the execute method for each token. It can be overridden
+        in order to perform the related operations using fewer queries.
+        """
+        for token in tokens:
+            self.execute(token)
+
     def can_be_consumed(self, token, user):
         """
         Given a token, returns a boolean indicating if it can be consumed by the considered user.
@@ -61,6 +96,33 @@ class AccountActionBase(with_metaclass(AccountActionMetaclass, object)):
         """
         return token.can_be_consumed
 
+    async def acan_be_consumed(self, token, user):
+        """
+        Async version of can_be_consumed, used by the async views.
+        The default implementation calls can_be_consumed in a thread if it is overridden.
+        """
+        if type(self).can_be_consumed is AccountActionBase.can_be_consumed:
+            return self.can_be_consumed(token, user)
+        return await sync_to_async(self.can_be_consumed)(token, user)
+
+    async def aexecute(self, token):
+        """
+        Async version of execute, used when tokens are consumed by the async views.
+        The default implementation calls execute in a thread.
+        """
+        await sync_to_async(self.execute)(token)
+
+    def get_expiration_date(self, token):
+        """
+        Given a token, returns the date after which it can no longer be consumed. This date is
+        stored on the token when it is created.
+        The default implementation uses the validity_duration attribute of the action.
+        """
+        validity_duration = self.validity_duration \
+            if self.validity_duration is not None \
+            else account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION
+        return token.created + dt.timedelta(days=validity_duration)
+
     def get_extra_context(self, token, user):
         """
         Given a token, returns a dictionary that can be used to extend the context of view that
@@ -69,6 +131,15 @@ class AccountActionBase(with_metaclass(AccountActionMetaclass, object)):
         """
         return {}
 
+    async def aget_extra_context(self, token, user):
+        """
+        Async version of get_extra_context, used by the async views.
+        The default implementation calls get_extra_context in a thread if it is overridden.
+        """
+        if type(self).get_extra_context is AccountActionBase.get_extra_context:
+            return self.get_extra_context(token, user)
+        return await sync_to_async(self.get_extra_context)(token, user)
+
     def get_consumption_redirect_url(self, token):
         """
         Given a consumed token, returns the URL to which the user should be redirected after The
@@ -83,10 +154,41 @@ class AccountActionBase(with_metaclass(AccountActionMetaclass, object)):
         """
         return _('The action was successfully performed!')
 
+    def get_notification_email(self, token):
+        """
+        Given a newly created token, returns the EmailMessage instance that should be sent to
+        notify the creation of the token.
+        The default implementation returns None, meaning that no email will be sent.
+        """
+        return None
+
     def send_notification_email(self, token):
         """
         A single method whose aim is to send a email to notify the creation of an action token.
-        It should be overridden on any subclass which have to send an email after the creation of
-        an action token.
+        The default implementation sends the message returned by get_notification_email (if any).
+        It can be overridden on any subclass which have to send an email after the creation of an
+        action token.
+        """
+        message = self.get_notification_email(token)
+        if message is not None:
+            message.send()
+
+    def send_notification_emails(self, tokens, connection=None):
+        """
+        Sends the notification emails of many action tokens at once.
+        The messages returned by get_notification_email are sent through a single mail
+        connection. Subclasses that override send_notification_email are supported: in that case
+        this method simply calls send_notification_email for each token.
         """
-        return
+        if type(self).send_notification_email is not AccountActionBase.send_notification_email:
+            for token in tokens:
+                self.send_notification_email(token)
+            return
+
+        messages = [self.get_notification_email(token) for token in tokens]
+        messages = [message for message in messages if message is not None]
+        if not messages:
+            return
+
+        connection = connection or mail.get_connection()
+        connection.send_messages(messages)
@@ -1,12 +1,54 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import datetime as dt
+from importlib import import_module
+import logging
+import threading
+import time
+from types import MappingProxyType
 
 from django.core.exceptions import ImproperlyConfigured
 
 from .action_base import AccountActionBase
+from .conf import settings as account_actions_settings
 from .core.loading import load
 from .exceptions import ActionAlreadyRegistered
+from .exceptions import ActionNotRegistered
+
+logger = logging.getLogger(__name__)
+
+# The methods of AccountActionBase that can be overridden by actions.
+HOOK_NAMES = (
+    'execute_many', 'aexecute', 'can_be_consumed', 'acan_be_consumed', 'get_expiration_date',
+    'get_extra_context', 'aget_extra_context', 'get_consumption_redirect_url',
+    'get_consumption_success_message', 'get_notification_email', 'send_notification_email',
+    'send_notification_emails', )
+
+
+class ActionEntry(object):
+    """
+    An entry of the dispatch table of the action pool: a registered action along with the names
+    of the hooks it overrides and its validity duration (a timedelta, or None if the action uses
+    the ACCOUNT_ACTION_TOKEN_VALIDITY_DURATION setting).
+    """
+    __slots__ = (
+        'action', 'overridden_hooks', 'sends_notification_emails', 'validity_duration',
+        'has_custom_expiration_date', )
+
+    def __init__(self, action):
+        self.action = action
+        self.overridden_hooks = frozenset(
+            name for name in HOOK_NAMES
+            if getattr(type(action), name) is not getattr(AccountActionBase, name))
+        # The default implementations of the notification hooks do not send anything.
+        self.sends_notification_emails = bool(self.overridden_hooks & {
+            'get_notification_email', 'send_notification_email', 'send_notification_emails'})
+        self.validity_duration = dt.timedelta(days=action.validity_duration) \
+            if action.validity_duration is not None else None
+        # The expiration dates of the tokens of actions overriding get_expiration_date can only
+        # be computed in Python.
+        self.has_custom_expiration_date = 'get_expiration_date' in self.overridden_hooks
 
 
 class AccountActionPool(object):
@@ -16,18 +58,49 @@ class AccountActionPool(object):
     """
     def __init__(self):
         self._registry = {}
+        self._table = None
+        self._discovery_lock = threading.RLock()
         self.discovered = False
+        # The time spent discovering the actions (in seconds) and the names of the imported
+        # modules.
+        self.discovery_duration = None
+        self.discovered_modules = ()
 
     def discover(self):
         """
         Discovers all the 'account_actions' Python modules that can be defined inside each Django
-        application listed in INSTALLED_APPS. Discovering these modules is necessary to force the
-        registration of AccountActionBase subclasses.
+        application listed in INSTALLED_APPS (or the modules listed in the ACCOUNT_ACTIONS_MODULES
+        setting). Discovering these modules is necessary to force the registration of
+        AccountActionBase subclasses.
         """
         if self.discovered:
             return
-        self.discovered = True
-        load('account_actions')
+        with self._discovery_lock:
+            if self.discovered:
+                return
+            start = time.perf_counter()
+            module_names = account_actions_settings.MODULES
+            if module_names is None:
+                module_names = load('account_actions')
+            else:
+                for module_name in module_names:
+                    import_module(module_name)
+            self.discovery_duration = time.perf_counter() - start
+            self.discovered_modules = tuple(module_names)
+            self.freeze()
+            self.discovered = True
+        logger.debug(
+            'Discovered the actions of %d modules in %.2f ms: %s', len(self.discovered_modules),
+            self.discovery_duration * 1000, ', '.join(self.discovered_modules))
+
+    def freeze(self):
+        """
+        Builds the immutable dispatch table associating the name of each registered action with
+        its ActionEntry and returns it. The table is rebuilt if actions are registered later on.
+        """
+        self._table = MappingProxyType(
+            {name: ActionEntry(action) for name, action in self._registry.items()})
+        return self._table
 
     def register(self, action_class):
         """
@@ -46,19 +119,52 @@ class AccountActionPool(object):
 
         action = action_class()
         self._registry[action_class.name] = action
+        if self._table is not None:
+            self.freeze()
 
     def unregister_all(self):
         """
         Unregister all the actions.
         """
         self._registry = {}
+        if self._table is not None:
+            self.freeze()
+
+    def get_entry(self, action_name):
+        """
+        Returns the ActionEntry associated with the given action name (or None).
+        """
+        self.discover()
+        table = self._table if self._table is not None else self.freeze()
+        return table.get(action_name)
+
+    def get_entries(self):
+        """
+        Returns the ActionEntry objects of all the registered actions.
+        """
+        self.discover()
+        table = self._table if self._table is not None else self.freeze()
+        return table.values()
 
     def get_action(self, action_name):
         """
         Returns the instance associated with the given action name.
         """
+        self.discover()
         return self._registry.get(action_name, None)
 
+    def get_action_or_raise(self, action_name):
+        """
+        Returns the instance associated with the given action name. ActionNotRegistered is
+        raised if no action is registered with this name.
+        """
+        self.discover()
+        try:
+            return self._registry[action_name]
+        except KeyError:
+            raise ActionNotRegistered(
+                'The following action is not registered: {}'.format(action_name))
+
     def get_actions(self):
         """
         Returns all the registered actions.
@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
-import datetime as dt
-
 from django.contrib import admin
+from django.contrib import messages
+from django.db import models
+from django.db import transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .cache import invalidate_cached_tokens
 from .conf import settings as account_actions_settings
+from .core.chunks import iter_pk_chunks
+from .core.paginator import EstimatedCountPaginator
+from .models import AccountActionExecution
 from .models import AccountActionToken
 
 
@@ -21,12 +27,11 @@ class IsExpiredFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         value = self.value()
-        dt_limit = timezone.now() - dt.timedelta(
-            days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
+        now = timezone.now()
         if value == 'Yes':
-            return queryset.filter(created__lt=dt_limit)
+            return queryset.filter(expires_at__lt=now)
         elif value == 'No':
-            return queryset.exclude(created__lt=dt_limit)
+            return queryset.filter(expires_at__gte=now)
         return queryset
 
 
@@ -43,9 +48,9 @@ class IsConsumedFilter(admin.SimpleListFilter):
     def queryset(self, request, queryset):
         value = self.value()
         if value == 'Yes':
-            return queryset.filter(consumption_date__isnull=False, user__isnull=False)
+            return queryset.filter(status=AccountActionToken.STATUS_CONSUMED)
         elif value == 'No':
-            return queryset.exclude(consumption_date__isnull=False, user__isnull=False)
+            return queryset.exclude(status=AccountActionToken.STATUS_CONSUMED)
         return queryset
 
 
@@ -56,25 +61,130 @@ class AccountActionTokenAdmin(admin.ModelAdmin):
     list_display_links = ('id', 'key', 'email', )
     list_filter = ('action', 'is_canceled', IsExpiredFilter, IsConsumedFilter, )
     search_fields = ('email', 'first_name', 'last_name', )
-    actions = ('cancel', 'uncancel', )
+    actions = ('cancel', 'uncancel', 'resend_notification', )
+
+    def get_queryset(self, request):
+        # The expired and consumed flags are computed by the database so that they can be used to
+        # sort the changelist.
+        qs = super(AccountActionTokenAdmin, self).get_queryset(request)
+        return qs.annotate(
+            expired_flag=models.Case(
+                models.When(expires_at__lt=timezone.now(), then=models.Value(True)),
+                default=models.Value(False), output_field=models.BooleanField()),
+            consumed_flag=models.Case(
+                models.When(
+                    consumption_date__isnull=False, user__isnull=False,
+                    then=models.Value(True)),
+                default=models.Value(False), output_field=models.BooleanField()),
+        )
+
+    def get_paginator(self, request, queryset, per_page, orphans=0,
+                      allow_empty_first_page=True):
+        if account_actions_settings.ADMIN_ESTIMATED_COUNT:
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super(AccountActionTokenAdmin, self).get_paginator(
+            request, queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_search_results(self, request, queryset, search_term):
+        if account_actions_settings.ADMIN_SEARCH_MODE != 'indexed':
+            return super(AccountActionTokenAdmin, self).get_search_results(
+                request, queryset, search_term)
+
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+
+        # The lowercased e-mail prefix is matched using a range lookup (which can use the
+        # lowercased e-mail index whatever the collation of the column is) in addition to the
+        # startswith lookup.
+        prefix = search_term.lower()
+        queryset = queryset.annotate(email_lower=Lower('email')).filter(
+            models.Q(key=search_term) | models.Q(
+                email_lower__gte=prefix, email_lower__lt=prefix + '\uffff',
+                email_lower__startswith=prefix))
+        return queryset, False
+
+    @property
+    def show_full_result_count(self):
+        # The full count of the changelist is not computed when estimated counts are used.
+        return not account_actions_settings.ADMIN_ESTIMATED_COUNT
+
+    def expiration_date(self, obj):
+        return obj.expires_at
+    expiration_date.admin_order_field = 'expires_at'
+    expiration_date.short_description = _('Expiration date')
 
     def is_expired(self, obj):
-        return obj.is_expired
+        return obj.expired_flag
+    is_expired.admin_order_field = 'expired_flag'
     is_expired.boolean = True
     is_expired.short_description = _('Expired')
 
     def is_consumed(self, obj):
-        return obj.is_consumed
+        return obj.consumed_flag
+    is_consumed.admin_order_field = 'consumed_flag'
     is_consumed.boolean = True
     is_consumed.short_description = _('Consumed')
 
     def cancel(self, request, queryset):
-        queryset.update(is_canceled=True)
+        count = self._update_by_chunks(queryset, is_canceled=True)
+        self.message_user(
+            request, _('%(count)d action tokens were canceled.') % {'count': count},
+            messages.SUCCESS)
     cancel.short_description = _('Cancel selected %(verbose_name_plural)s')
 
     def uncancel(self, request, queryset):
-        queryset.update(is_canceled=False)
+        count = self._update_by_chunks(queryset, is_canceled=False)
+        self.message_user(
+            request, _('%(count)d action tokens were uncanceled.') % {'count': count},
+            messages.SUCCESS)
     uncancel.short_description = _('Uncancel selected %(verbose_name_plural)s')
 
+    def resend_notification(self, request, queryset):
+        # Only the pending action tokens are notified again.
+        queryset = queryset.filter(
+            status=AccountActionToken.STATUS_PENDING, expires_at__gte=timezone.now())
+        chunk_size = account_actions_settings.ADMIN_ACTION_CHUNK_SIZE
+        count = 0
+        tokens = []
+        for token in queryset.iterator(chunk_size=chunk_size):
+            tokens.append(token)
+            if len(tokens) == chunk_size:
+                AccountActionToken.objects.send_notification_emails(tokens)
+                count += len(tokens)
+                tokens = []
+        if tokens:
+            AccountActionToken.objects.send_notification_emails(tokens)
+            count += len(tokens)
+        self.message_user(
+            request,
+            _('The notifications of %(count)d pending action tokens were sent.') % {
+                'count': count},
+            messages.SUCCESS)
+    resend_notification.short_description = _(
+        'Resend the notification of selected %(verbose_name_plural)s')
+
+    def _update_by_chunks(self, queryset, is_canceled):
+        # Tokens are updated by chunks of primary keys, each chunk being updated in its own
+        # transaction, in order to avoid locking many rows during a long time.
+        count = 0
+        chunk_size = account_actions_settings.ADMIN_ACTION_CHUNK_SIZE
+        for pks in iter_pk_chunks(queryset, chunk_size):
+            with transaction.atomic():
+                chunk_queryset = AccountActionToken.objects.filter(pk__in=pks)
+                invalidate_cached_tokens(chunk_queryset.values_list('key', flat=True))
+                count += chunk_queryset.update(
+                    is_canceled=is_canceled,
+                    status=AccountActionToken.get_status_expression(is_canceled=is_canceled))
+        return count
+
+
+class AccountActionExecutionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'token', 'status', 'attempts', 'next_attempt_date', 'updated', )
+    list_filter = ('status', )
+    list_select_related = ('token', )
+    raw_id_fields = ('token', )
+
 
 admin.site.register(AccountActionToken, AccountActionTokenAdmin)
+admin.site.register(AccountActionExecution, AccountActionExecutionAdmin)
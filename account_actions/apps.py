@@ -10,4 +10,6 @@ class AccountActionsConfig(AppConfig):
     def ready(self):
         from . import receivers  # noqa
         from .action_pool import actions
-        actions.discover()
+        from .conf import settings as account_actions_settings
+        if not account_actions_settings.LAZY_DISCOVERY:
+            actions.discover()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import hashlib
+
+from django.core.cache import caches
+
+from .conf import settings as account_actions_settings
+
+# The value cached for keys that are not associated with any action token.
+MISSING_TOKEN = 'account_actions:missing'
+
+
+def get_token_cache():
+    """ Returns the cache used to store action tokens, or None if action tokens are not cached. """
+    alias = account_actions_settings.TOKEN_CACHE
+    return caches[alias] if alias else None
+
+
+def get_token_cache_key(key):
+    """ Returns the cache key associated with the given action token key. """
+    # Keys come from URLs: they are hashed in order to get valid cache keys for any backend.
+    return 'account_actions:token:{}'.format(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def get_cached_token(key, queryset):
+    """
+    Returns the action token associated with the given key, using the cache if possible. The
+    DoesNotExist exception of the model is raised if the token cannot be found (keys that are
+    not associated with any action token are also cached).
+    """
+    cache = get_token_cache()
+    if cache is None:
+        return queryset.get(key=key)
+
+    cache_key = get_token_cache_key(key)
+    token = cache.get(cache_key)
+    if token == MISSING_TOKEN:
+        raise queryset.model.DoesNotExist
+    elif token is not None:
+        return token
+
+    try:
+        token = queryset.get(key=key)
+    except queryset.model.DoesNotExist:
+        cache.set(cache_key, MISSING_TOKEN, account_actions_settings.TOKEN_CACHE_NEGATIVE_TIMEOUT)
+        raise
+    cache.set(cache_key, token, account_actions_settings.TOKEN_CACHE_TIMEOUT)
+    return token
+
+
+def invalidate_cached_tokens(keys):
+    """ Removes the action tokens associated with the given keys from the cache. """
+    cache = get_token_cache()
+    if cache is not None:
+        cache.delete_many([get_token_cache_key(key) for key in keys])
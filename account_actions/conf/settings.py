@@ -6,3 +6,124 @@ from django.conf import settings
 # Use this setting to specify a duration of validation for action tokens. This duration should be
 # expressed as a number of days.
 ACTION_TOKEN_VALIDITY_DURATION = getattr(settings, 'ACCOUNT_ACTION_TOKEN_VALIDITY_DURATION', 10)
+
+# Use this setting to specify the number of action tokens that are inserted (and notified) at once
+# when action tokens are issued in bulk.
+BULK_ISSUE_BATCH_SIZE = getattr(settings, 'ACCOUNT_ACTION_BULK_ISSUE_BATCH_SIZE', 1000)
+
+# Use this setting to specify the number of days during which expired, canceled and consumed action
+# tokens are kept before being deleted by the purge_account_action_tokens management command.
+TOKEN_RETENTION_DURATION = getattr(settings, 'ACCOUNT_ACTION_TOKEN_RETENTION_DURATION', 90)
+
+# Use this setting to specify retention durations (expressed as a number of days) for specific
+# actions. The keys of this dictionary are action names ; a None value means that the tokens of the
+# considered action are never purged.
+TOKEN_RETENTION_DURATIONS = getattr(settings, 'ACCOUNT_ACTION_TOKEN_RETENTION_DURATIONS', {})
+
+# Use this setting to specify the number of action tokens that are deleted at once when purging
+# action tokens.
+PURGE_CHUNK_SIZE = getattr(settings, 'ACCOUNT_ACTION_PURGE_CHUNK_SIZE', 1000)
+
+# Use this setting to specify the number of action tokens that are updated at once when refreshing
+# the expiration dates of action tokens.
+EXPIRATION_REFRESH_CHUNK_SIZE = getattr(
+    settings, 'ACCOUNT_ACTION_EXPIRATION_REFRESH_CHUNK_SIZE', 1000)
+
+# Use this setting to specify how notification emails are sent when action tokens are created. The
+# value can be 'inline' (emails are sent while saving action tokens), 'on_commit' (emails are sent
+# once the current transaction is committed), 'thread_pool' (emails are sent by a pool of threads
+# once the current transaction is committed) or the dotted path of a custom dispatcher class.
+NOTIFICATION_DISPATCHER = getattr(settings, 'ACCOUNT_ACTION_NOTIFICATION_DISPATCHER', 'inline')
+
+# Use this setting to specify the keyword arguments used to initialize the notification dispatcher.
+# For example the 'thread_pool' dispatcher accepts the following arguments: max_workers,
+# max_queue_size, max_retries and retry_delay.
+NOTIFICATION_DISPATCHER_OPTIONS = getattr(
+    settings, 'ACCOUNT_ACTION_NOTIFICATION_DISPATCHER_OPTIONS', {})
+
+# Use this setting to specify the maximum number of times the execution of an action running in the
+# background is attempted.
+EXECUTION_MAX_ATTEMPTS = getattr(settings, 'ACCOUNT_ACTION_EXECUTION_MAX_ATTEMPTS', 5)
+
+# Use this setting to specify the delay (expressed as a number of seconds) before retrying a failed
+# background execution for the first time. This delay is doubled after each failed attempt.
+EXECUTION_RETRY_DELAY = getattr(settings, 'ACCOUNT_ACTION_EXECUTION_RETRY_DELAY', 60)
+
+# Use this setting to specify the duration (expressed as a number of seconds) during which a worker
+# owns a background execution it has claimed. An execution that is still running once this delay is
+# elapsed (eg. because its worker died) is claimed again and counts as a failed attempt. This
+# duration should be greater than the longest execution time of an action.
+EXECUTION_LEASE_DURATION = getattr(settings, 'ACCOUNT_ACTION_EXECUTION_LEASE_DURATION', 600)
+
+# Use this setting to specify the alias of the cache (as defined in the CACHES setting) used to
+# cache the action tokens displayed by the landing view. Action tokens are not cached if this value
+# is None.
+TOKEN_CACHE = getattr(settings, 'ACCOUNT_ACTION_TOKEN_CACHE', None)
+
+# Use this setting to specify the number of seconds during which action tokens are cached.
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'ACCOUNT_ACTION_TOKEN_CACHE_TIMEOUT', 300)
+
+# Use this setting to specify the number of seconds during which the keys that are not associated
+# with any action token are cached.
+TOKEN_CACHE_NEGATIVE_TIMEOUT = getattr(
+    settings, 'ACCOUNT_ACTION_TOKEN_CACHE_NEGATIVE_TIMEOUT', 30)
+
+# Use this setting to specify how action tokens are searched in the admin. The 'default' mode
+# searches the e-mail addresses and names of action tokens using case-insensitive containment
+# lookups. The 'indexed' mode only performs lookups that can use indexes: exact key lookups and
+# case-insensitive e-mail prefix lookups.
+ADMIN_SEARCH_MODE = getattr(settings, 'ACCOUNT_ACTION_ADMIN_SEARCH_MODE', 'default')
+
+# Use this setting to indicate that the admin should display estimated counts instead of running a
+# full COUNT query on unfiltered changelists (estimates are only available on PostgreSQL and MySQL).
+ADMIN_ESTIMATED_COUNT = getattr(settings, 'ACCOUNT_ACTION_ADMIN_ESTIMATED_COUNT', False)
+
+# Use this setting to specify the number of action tokens that are processed in each transaction by
+# the actions of the admin (cancel, uncancel and resend notification).
+ADMIN_ACTION_CHUNK_SIZE = getattr(settings, 'ACCOUNT_ACTION_ADMIN_ACTION_CHUNK_SIZE', 1000)
+
+# Use this setting to indicate if the action_token_consumed signal should be sent for each token
+# consumed by bulk operations (in addition to the action_tokens_consumed signal). It can be
+# disabled once all the receivers of action_token_consumed handle action_tokens_consumed.
+FAN_OUT_CONSUMED_SIGNAL = getattr(settings, 'ACCOUNT_ACTION_FAN_OUT_CONSUMED_SIGNAL', True)
+
+# Use this setting to specify the format of the keys of new action tokens: 'uuid' (random UUIDs)
+# or 'signed' (keys embedding their generation timestamp and an HMAC signature using SECRET_KEY,
+# which allows views to reject forged keys without querying the database).
+KEY_FORMAT = getattr(settings, 'ACCOUNT_ACTION_KEY_FORMAT', 'uuid')
+
+# Use this setting to specify the number of days after which signed keys are rejected without
+# querying the database. By default the longest validity duration of the registered actions is
+# used (no limit is applied if an action overrides get_expiration_date).
+SIGNED_KEY_MAX_AGE = getattr(settings, 'ACCOUNT_ACTION_SIGNED_KEY_MAX_AGE', None)
+
+# Use this setting to specify the rate limiter used by the generic views before looking up action
+# tokens: 'none' (default), 'cache' (counters stored in a Django cache) or the dotted path of a
+# subclass of account_actions.ratelimit.BaseRateLimiter. Rate limited requests get an HTTP 429
+# response.
+RATE_LIMITER = getattr(settings, 'ACCOUNT_ACTION_RATE_LIMITER', 'none')
+
+# Use this setting to specify the keyword arguments used to instantiate the rate limiter (eg.
+# {'cache': 'default', 'rate_per_ip': 60, 'rate_per_key': 10, 'period': 60} for the 'cache' rate
+# limiter).
+RATE_LIMITER_OPTIONS = getattr(settings, 'ACCOUNT_ACTION_RATE_LIMITER_OPTIONS', {})
+
+# Use this setting to specify the list of the modules defining actions (eg.
+# ['myapp.account_actions']). By default the 'account_actions' module of each installed
+# application is imported if it exists, which requires to scan all the installed applications.
+MODULES = getattr(settings, 'ACCOUNT_ACTIONS_MODULES', None)
+
+# Use this setting to indicate that actions should be discovered the first time an action is
+# looked up instead of when the application registry is ready. This can reduce the startup time of
+# processes that never use actions (eg. most management commands).
+LAZY_DISCOVERY = getattr(settings, 'ACCOUNT_ACTION_LAZY_DISCOVERY', False)
+
+# Use this setting to specify the backend receiving the timings and counters of the hot code paths
+# (token issuance, lookups, consumption, execution of actions and notification dispatch):
+# 'null' (default), 'logging', 'memory', 'statsd' or the dotted path of a subclass of
+# account_actions.instrumentation.BaseMetricsBackend.
+METRICS_BACKEND = getattr(settings, 'ACCOUNT_ACTION_METRICS_BACKEND', 'null')
+
+# Use this setting to specify the keyword arguments used to instantiate the metrics backend (eg.
+# {'host': '127.0.0.1', 'port': 8125, 'prefix': 'account_actions'} for the 'statsd' backend).
+METRICS_BACKEND_OPTIONS = getattr(settings, 'ACCOUNT_ACTION_METRICS_BACKEND_OPTIONS', {})
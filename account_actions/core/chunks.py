@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+
+def iter_pk_chunks(queryset, chunk_size):
+    """
+    Yields the primary keys of the objects of the given queryset as lists of at most chunk_size
+    elements. Each chunk is fetched using a separate query that starts after the last primary key
+    of the previous chunk, so the objects of a chunk can be modified (or deleted) before the next
+    chunk is fetched.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk_queryset.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
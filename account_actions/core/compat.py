@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
+
+from asgiref.sync import sync_to_async
+
 
 def with_metaclass(meta, *bases):
     """ Creates a base class with a metaclass. """
@@ -12,3 +16,41 @@ def with_metaclass(meta, *bases):
                 return type.__new__(cls, name, (), d)
             return meta(name, bases, d)
     return metaclass('NewBase', None, {})
+
+
+# Async helpers: the async ORM methods and request.auser() are only available on recent Django
+# versions, the other versions fall back to the sync methods run through sync_to_async.
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:  # pragma: no cover
+    def markcoroutinefunction(func):
+        """ Marks the given function as a coroutine function. """
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+async def aget(queryset, *args, **kwargs):
+    """ Async version of QuerySet.get. """
+    if hasattr(queryset, 'aget'):
+        return await queryset.aget(*args, **kwargs)
+    return await sync_to_async(queryset.get)(*args, **kwargs)
+
+
+async def aupdate(queryset, **kwargs):
+    """ Async version of QuerySet.update. """
+    if hasattr(queryset, 'aupdate'):
+        return await queryset.aupdate(**kwargs)
+    return await sync_to_async(queryset.update)(**kwargs)
+
+
+async def aget_user(request):
+    """ Returns the user associated with the given request (which can require a query). """
+    if hasattr(request, 'auser'):
+        return await request.auser()
+
+    def _get_user():
+        # Accessing an attribute of the lazy user object forces its evaluation.
+        request.user.is_authenticated
+        return request.user
+    return await sync_to_async(_get_user)()
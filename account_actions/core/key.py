@@ -1,9 +1,92 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import unicode_literals
+import re
+import time
 import uuid
 
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import constant_time_compare
+from django.utils.crypto import get_random_string
 
-def gen_action_key():
-    """ Returns an action key: a random UUID. """
+from ..conf import settings as account_actions_settings
+
+
+KEY_FORMAT_UUID = 'uuid'
+KEY_FORMAT_SIGNED = 'signed'
+KEY_FORMATS = (KEY_FORMAT_UUID, KEY_FORMAT_SIGNED, )
+
+# A signed key is made of a random string, of the timestamp at which the key was generated (in
+# hexadecimal) and of a truncated HMAC signature of both values. It fits in the 40 characters of
+# the key field.
+SIGNED_KEY_RANDOM_LENGTH = 12
+SIGNED_KEY_TIMESTAMP_LENGTH = 8
+SIGNED_KEY_SIGNATURE_LENGTH = 20
+SIGNED_KEY_VALUE_LENGTH = SIGNED_KEY_RANDOM_LENGTH + SIGNED_KEY_TIMESTAMP_LENGTH
+SIGNED_KEY_LENGTH = SIGNED_KEY_VALUE_LENGTH + SIGNED_KEY_SIGNATURE_LENGTH
+
+UUID_KEY_RE = re.compile(r'[0-9a-f]{32}')
+SIGNED_KEY_RE = re.compile(r'[0-9A-Za-z]{%d}[0-9a-f]{%d}[0-9A-Za-z_-]{%d}' % (
+    SIGNED_KEY_RANDOM_LENGTH, SIGNED_KEY_TIMESTAMP_LENGTH, SIGNED_KEY_SIGNATURE_LENGTH))
+
+
+def gen_action_key(key_format=None):
+    """
+    Returns an action key using the given format (which defaults to the
+    ACCOUNT_ACTION_KEY_FORMAT setting): a random UUID or a signed key.
+    """
+    key_format = key_format or account_actions_settings.KEY_FORMAT
+    if key_format not in KEY_FORMATS:
+        raise ImproperlyConfigured(
+            'The key format must be one of {!r}, {!r} is not'.format(KEY_FORMATS, key_format))
+    if key_format == KEY_FORMAT_SIGNED:
+        return gen_signed_action_key()
     return uuid.uuid4().hex
+
+
+def gen_signed_action_key(timestamp=None):
+    """
+    Returns a signed action key embedding the given timestamp (which defaults to the current
+    time). The authenticity of such a key can be checked without querying the database.
+    """
+    timestamp = int(time.time() if timestamp is None else timestamp)
+    value = get_random_string(SIGNED_KEY_RANDOM_LENGTH) \
+        + '{:0{}x}'.format(timestamp, SIGNED_KEY_TIMESTAMP_LENGTH)
+    return value + _get_signature(value)
+
+
+def is_valid_action_key(key):
+    """
+    Returns a boolean indicating if the given value has the shape of an action key (a UUID or a
+    signed key). The authenticity of signed keys is not checked.
+    """
+    return isinstance(key, str) \
+        and (UUID_KEY_RE.fullmatch(key) is not None or SIGNED_KEY_RE.fullmatch(key) is not None)
+
+
+def is_signed_action_key(key):
+    """ Returns a boolean indicating if the given key has the shape of a signed key. """
+    return isinstance(key, str) and SIGNED_KEY_RE.fullmatch(key) is not None
+
+
+def check_signed_action_key(key, max_age=None):
+    """
+    Returns a boolean indicating if the given signed key is authentic and, if a max_age
+    (timedelta) is given, if it was generated less than max_age ago.
+    """
+    if not is_signed_action_key(key):
+        return False
+    value, signature = key[:SIGNED_KEY_VALUE_LENGTH], key[SIGNED_KEY_VALUE_LENGTH:]
+    if not constant_time_compare(signature, _get_signature(value)):
+        return False
+    if max_age is not None:
+        timestamp = int(value[SIGNED_KEY_RANDOM_LENGTH:], 16)
+        if time.time() - timestamp > max_age.total_seconds():
+            return False
+    return True
+
+
+def _get_signature(value):
+    signer = signing.Signer(salt='account_actions.key', algorithm='sha256')
+    return signer.signature(value)[:SIGNED_KEY_SIGNATURE_LENGTH]
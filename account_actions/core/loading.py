@@ -8,7 +8,10 @@ from django.conf import settings
 
 
 def load(modname):
-    """ Loads all the modules that are named 'modname' from all the installed applications. """
+    """
+    Loads all the modules that are named 'modname' from all the installed applications and
+    returns the names of the imported modules.
+    """
 
     def _get_module(app, modname):
         # Find out the app's __path__
@@ -22,7 +25,9 @@ def load(modname):
             return
 
         # Import the app's module file
-        import_module('{}.{}'.format(app, modname))
+        module_name = '{}.{}'.format(app, modname)
+        import_module(module_name)
+        return module_name
 
-    for app in settings.INSTALLED_APPS:
-        _get_module(app, modname)
+    module_names = [_get_module(app, modname) for app in settings.INSTALLED_APPS]
+    return [module_name for module_name in module_names if module_name is not None]
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that uses the table statistics of the database to estimate the number of
+    objects of unfiltered querysets, instead of running a full COUNT query. An exact count is
+    used for filtered querysets, when no estimate is available, or when the estimate is lower than
+    the estimate_threshold attribute.
+    """
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.get_estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super(EstimatedCountPaginator, self).count
+
+    def get_estimated_count(self):
+        """ Returns the estimated number of objects, or None if no estimate is available. """
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return None
+
+        connection = connections[queryset.db]
+        db_table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass'
+            params = [connection.ops.quote_name(db_table), ]
+        elif connection.vendor == 'mysql':
+            sql = 'SELECT table_rows FROM information_schema.tables ' \
+                  'WHERE table_schema = DATABASE() AND table_name = %s'
+            params = [db_table, ]
+        else:
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from django.db import connections
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .conf import settings as account_actions_settings
+from .instrumentation import incr
+
+logger = logging.getLogger(__name__)
+
+
+class BaseDispatcher(object):
+    """
+    Dispatchers are used to run functions (eg. the functions sending the notification emails of
+    action tokens) outside of the code path that triggered them.
+    """
+    def dispatch(self, func, *args, **kwargs):
+        """ Runs (or schedules) the given function with the given arguments. """
+        raise NotImplementedError
+
+
+class InlineDispatcher(BaseDispatcher):
+    """ Runs functions immediately. """
+    def dispatch(self, func, *args, **kwargs):
+        func(*args, **kwargs)
+
+
+class OnCommitDispatcher(BaseDispatcher):
+    """ Runs functions once the current transaction is committed. """
+    def __init__(self, using=None):
+        self.using = using
+
+    def dispatch(self, func, *args, **kwargs):
+        transaction.on_commit(lambda: func(*args, **kwargs), using=self.using)
+
+
+class ThreadPoolDispatcher(BaseDispatcher):
+    """
+    Runs functions in a pool of threads once the current transaction is committed.
+
+    At most max_queue_size functions can be waiting or running at the same time: if this limit
+    is reached, a function waits at most queue_timeout seconds for a slot and is then dropped (a
+    warning is logged and the dispatcher.dropped counter is incremented). Dropped functions are
+    not run inline because this would make the committing thread (eg. a request) slower exactly
+    when the pool is overloaded. Failing functions are retried at most max_retries times, with an
+    exponential backoff delay starting at retry_delay seconds.
+    """
+    def __init__(
+            self, max_workers=4, max_queue_size=1000, queue_timeout=0, max_retries=2,
+            retry_delay=1, using=None):
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.using = using
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_queue_size)
+
+    def dispatch(self, func, *args, **kwargs):
+        transaction.on_commit(lambda: self._submit(func, args, kwargs), using=self.using)
+
+    def shutdown(self, wait=True):
+        """ Stops the pool of threads. Pending functions are run if wait is True. """
+        self._executor.shutdown(wait=wait)
+
+    def _submit(self, func, args, kwargs):
+        if self.queue_timeout:
+            acquired = self._slots.acquire(True, self.queue_timeout)
+        else:
+            acquired = self._slots.acquire(False)
+        if not acquired:
+            logger.warning(
+                'The queue of the thread pool dispatcher is full: {!r} is dropped'.format(func))
+            incr('dispatcher.dropped')
+            return
+        self._executor.submit(self._run, func, args, kwargs)
+
+    def _run(self, func, args, kwargs):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    func(*args, **kwargs)
+                    return
+                except Exception:
+                    if attempt == self.max_retries:
+                        logger.exception('Unable to run {!r}'.format(func))
+                    else:
+                        time.sleep(self.retry_delay * 2 ** attempt)
+        finally:
+            self._slots.release()
+            # Database connections are opened per thread: they must be closed explicitly.
+            connections.close_all()
+
+
+DISPATCHERS = {
+    'inline': InlineDispatcher,
+    'on_commit': OnCommitDispatcher,
+    'thread_pool': ThreadPoolDispatcher,
+}
+
+_notification_dispatcher = None
+_notification_dispatcher_config = None
+
+
+def get_notification_dispatcher():
+    """
+    Returns the dispatcher used to send notification emails, as configured by the
+    ACCOUNT_ACTION_NOTIFICATION_DISPATCHER and ACCOUNT_ACTION_NOTIFICATION_DISPATCHER_OPTIONS
+    settings.
+    """
+    global _notification_dispatcher, _notification_dispatcher_config
+    config = (
+        account_actions_settings.NOTIFICATION_DISPATCHER,
+        account_actions_settings.NOTIFICATION_DISPATCHER_OPTIONS, )
+    if _notification_dispatcher is None or config != _notification_dispatcher_config:
+        dispatcher_class = DISPATCHERS.get(config[0]) or import_string(config[0])
+        _notification_dispatcher = dispatcher_class(**config[1])
+        _notification_dispatcher_config = config
+    return _notification_dispatcher
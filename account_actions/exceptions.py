@@ -5,3 +5,11 @@ from __future__ import unicode_literals
 
 class ActionAlreadyRegistered(Exception):
     pass
+
+
+class ActionNotRegistered(Exception):
+    pass
+
+
+class ExecutionClaimLost(Exception):
+    pass
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+import socket
+import threading
+import time
+
+from django.utils.module_loading import import_string
+
+from .conf import settings as account_actions_settings
+
+logger = logging.getLogger(__name__)
+
+
+class BaseMetricsBackend(object):
+    """
+    Metrics backends receive the timing events (durations are expressed in seconds) and the
+    counter increments of the hot code paths of the application. Events can be tagged, eg. with
+    the name of the considered action.
+    """
+    def timing(self, name, duration, tags=None):
+        raise NotImplementedError
+
+    def incr(self, name, value=1, tags=None):
+        raise NotImplementedError
+
+
+class NullMetricsBackend(BaseMetricsBackend):
+    """ Discards all the events. """
+    def timing(self, name, duration, tags=None):
+        pass
+
+    def incr(self, name, value=1, tags=None):
+        pass
+
+
+class LoggingMetricsBackend(BaseMetricsBackend):
+    """ Logs all the events using the given logging level. """
+    def __init__(self, level=logging.DEBUG):
+        self.level = level
+
+    def timing(self, name, duration, tags=None):
+        logger.log(self.level, '%s took %.3f ms %s', name, duration * 1000, tags or {})
+
+    def incr(self, name, value=1, tags=None):
+        logger.log(self.level, '%s incremented by %d %s', name, value, tags or {})
+
+
+class InMemoryMetricsBackend(BaseMetricsBackend):
+    """
+    Stores the events in memory (eg. in tests). Timings and counters are stored per metric name
+    and per set of tags.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timings = defaultdict(list)
+            self.counters = defaultdict(int)
+
+    def timing(self, name, duration, tags=None):
+        with self._lock:
+            self.timings[self._get_key(name, tags)].append(duration)
+
+    def incr(self, name, value=1, tags=None):
+        with self._lock:
+            self.counters[self._get_key(name, tags)] += value
+
+    def get_timings(self, name, **tags):
+        """ Returns the durations recorded for the given metric name and tags. """
+        return self.timings.get(self._get_key(name, tags), [])
+
+    def get_count(self, name, **tags):
+        """ Returns the value of the counter associated with the given metric name and tags. """
+        return self.counters.get(self._get_key(name, tags), 0)
+
+    def _get_key(self, name, tags):
+        return (name, tuple(sorted((tags or {}).items())))
+
+
+class StatsdMetricsBackend(BaseMetricsBackend):
+    """
+    Sends the events to a statsd server using UDP packets. Tags are appended to the metric names
+    (eg. "account_actions.action.execute.add-to-group") unless use_tags is set, in which case
+    they are sent using the DogStatsD format.
+    """
+    def __init__(self, host='127.0.0.1', port=8125, prefix='account_actions', use_tags=False):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.use_tags = use_tags
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, duration, tags=None):
+        self._send(name, '{:.3f}|ms'.format(duration * 1000), tags)
+
+    def incr(self, name, value=1, tags=None):
+        self._send(name, '{}|c'.format(value), tags)
+
+    def _send(self, name, value, tags):
+        name = '{}.{}'.format(self.prefix, name) if self.prefix else name
+        if tags and self.use_tags:
+            packet = '{}:{}|#{}'.format(
+                name, value, ','.join('{}:{}'.format(k, v) for k, v in sorted(tags.items())))
+        elif tags:
+            packet = '{}.{}:{}'.format(
+                name, '.'.join(str(v) for _, v in sorted(tags.items())), value)
+        else:
+            packet = '{}:{}'.format(name, value)
+        try:
+            self.socket.sendto(packet.encode('utf-8'), self.address)
+        except OSError:  # pragma: no cover
+            # Metrics must never break the instrumented code paths.
+            logger.debug('Unable to send the following metric: %s', packet)
+
+
+METRICS_BACKENDS = {
+    'null': NullMetricsBackend,
+    'logging': LoggingMetricsBackend,
+    'memory': InMemoryMetricsBackend,
+    'statsd': StatsdMetricsBackend,
+}
+
+_metrics_backend = None
+_metrics_backend_config = None
+
+
+def get_metrics_backend():
+    """
+    Returns the metrics backend, as configured by the ACCOUNT_ACTION_METRICS_BACKEND and
+    ACCOUNT_ACTION_METRICS_BACKEND_OPTIONS settings.
+    """
+    global _metrics_backend, _metrics_backend_config
+    config = (
+        account_actions_settings.METRICS_BACKEND,
+        account_actions_settings.METRICS_BACKEND_OPTIONS, )
+    if _metrics_backend is None or config != _metrics_backend_config:
+        backend_class = METRICS_BACKENDS.get(config[0]) or import_string(config[0])
+        _metrics_backend = backend_class(**config[1])
+        _metrics_backend_config = config
+    return _metrics_backend
+
+
+@contextmanager
+def timed(name, **tags):
+    """ Sends a timing event for the execution of the wrapped block of code. """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics_backend().timing(name, time.perf_counter() - start, tags or None)
+
+
+def incr(name, value=1, **tags):
+    """ Increments the counter associated with the given metric name. """
+    get_metrics_backend().incr(name, value, tags or None)
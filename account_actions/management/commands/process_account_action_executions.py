@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...models import AccountActionExecution
+
+
+class Command(BaseCommand):
+    help = 'Runs the actions that must be executed in the background.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true', default=False,
+            help='Runs the due executions and exits instead of polling the queue.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Maximum number of executions that are run between two polls of the queue.')
+        parser.add_argument(
+            '--sleep', type=float, default=5,
+            help='Number of seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        while True:
+            run_count = AccountActionExecution.objects.run_due_executions(
+                limit=options['batch_size'])
+            if run_count:
+                self.stdout.write('{} executions run.'.format(run_count))
+            if options['once']:
+                return
+            if not run_count:
+                time.sleep(options['sleep'])
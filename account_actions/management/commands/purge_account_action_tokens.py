@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from ...conf import settings as account_actions_settings
+from ...models import AccountActionToken
+
+
+class Command(BaseCommand):
+    help = 'Deletes the expired, canceled and consumed action tokens older than their retention.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--retention', type=int, dest='retention_duration', default=None,
+            help='Number of days during which expired, canceled and consumed tokens are kept '
+                 '(defaults to ACCOUNT_ACTION_TOKEN_RETENTION_DURATION).')
+        parser.add_argument(
+            '--chunk-size', type=int, default=account_actions_settings.PURGE_CHUNK_SIZE,
+            help='Number of tokens deleted in each transaction.')
+        parser.add_argument(
+            '--dry-run', action='store_true', default=False,
+            help='Only displays the number of tokens that would be deleted.')
+
+    def handle(self, *args, **options):
+        retention_duration = options['retention_duration']
+        queryset = AccountActionToken.objects.get_purgeable_queryset(retention_duration)
+
+        if options['dry_run']:
+            self.stdout.write('{} action tokens would be deleted.'.format(queryset.count()))
+            return
+
+        deleted = AccountActionToken.objects.purge(
+            retention_duration=retention_duration, chunk_size=options['chunk_size'],
+            callback=lambda count: self.stdout.write('{} action tokens deleted...'.format(count)))
+        self.stdout.write(self.style.SUCCESS('{} action tokens deleted.'.format(deleted)))
@@ -1,13 +1,44 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 import datetime as dt
+import logging
 
-from django.db.models import Q
+from asgiref.sync import sync_to_async
 from django.contrib.contenttypes.models import ContentType
+from django.db import connections
 from django.db import models
+from django.db import transaction
+from django.db.models import Case
+from django.db.models import CharField
+from django.db.models import DateTimeField
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
 from django.utils import timezone
 
+from . import signals
+from .action_pool import actions
+from .cache import invalidate_cached_tokens
 from .conf import settings as account_actions_settings
+from .core.chunks import iter_pk_chunks
+from .core.compat import aget
+from .core.compat import aupdate
+from .core.key import gen_action_key
+from .dispatchers import get_notification_dispatcher
+from .instrumentation import incr
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+# The results of the consumption of a token by AccountActionTokenManager.consume_many.
+CONSUME_RESULT_CONSUMED = 'consumed'
+CONSUME_RESULT_NOT_FOUND = 'not_found'
+CONSUME_RESULT_ALREADY_CONSUMED = 'already_consumed'
+CONSUME_RESULT_CANCELED = 'canceled'
+CONSUME_RESULT_EXPIRED = 'expired'
+CONSUME_RESULT_FORBIDDEN = 'forbidden'
 
 
 class BaseAccountActionTokenManager(models.Manager):
@@ -17,19 +48,346 @@ class BaseAccountActionTokenManager(models.Manager):
         return qs.filter(
             content_type=ContentType.objects.get_for_model(obj), object_id=obj.id)
 
+    def get_for_objects(self, objs):
+        """
+        Returns a dictionary associating each of the given content objects with the list of its
+        tokens. The content types of the objects are resolved at once and a single query is
+        performed for each model.
+        """
+        objs_per_model = OrderedDict()
+        for obj in objs:
+            objs_per_model.setdefault(type(obj), {})[obj.pk] = obj
+
+        content_types = ContentType.objects.get_for_models(*objs_per_model.keys())
+        content_object_field = self.model._meta.get_field('content_object')
+        tokens_per_object = {}
+        for model, model_objs in objs_per_model.items():
+            for obj in model_objs.values():
+                tokens_per_object[obj] = []
+            qs = self.get_queryset().filter(
+                content_type=content_types[model], object_id__in=list(model_objs))
+            for token in qs:
+                obj = model_objs[token.object_id]
+                # The content object is already known: it must not be fetched again.
+                content_object_field.set_cached_value(token, obj)
+                tokens_per_object[obj].append(token)
+        return tokens_per_object
+
+
+class AccountActionTokenManager(BaseAccountActionTokenManager):
+    def bulk_issue(self, tokens, batch_size=None, notify=True):
+        """
+        Creates many action tokens at once and returns them.
+
+        The keys of the tokens are generated before inserting them using batched INSERT queries.
+        The notification emails of each batch of tokens are then sent using the
+        send_notification_emails method of the related actions. Note that the post_save signal is
+        not sent for tokens that are created using this method.
+
+        On database backends that cannot return the primary keys of bulk inserted rows (eg.
+        SQLite and MySQL), each batch of tokens is fetched again after its insertion so that the
+        returned (and notified) tokens are saved instances.
+        """
+        batch_size = batch_size or account_actions_settings.BULK_ISSUE_BATCH_SIZE
+        tokens = list(tokens)
+        for token in tokens:
+            if not token.key:
+                token.key = gen_action_key()
+            token.update_denormalized_fields()
+
+        can_return_rows = connections[self.db].features.can_return_rows_from_bulk_insert
+        created_tokens = []
+        for i in range(0, len(tokens), batch_size):
+            with timed('token.bulk_issue'):
+                batch = self.bulk_create(tokens[i:i + batch_size])
+                if not can_return_rows:
+                    keys = [token.key for token in batch]
+                    saved_tokens = {token.key: token for token in self.filter(key__in=keys)}
+                    batch = [saved_tokens[key] for key in keys]
+            # The keys of the new tokens could have been cached as missing.
+            invalidate_cached_tokens([token.key for token in batch])
+            if notify:
+                self.send_notification_emails(batch)
+            created_tokens.extend(batch)
+        return created_tokens
+
+    def try_consume(self, key, user, token=None):
+        """
+        Consumes the action token associated with the given key for the given user.
+
+        The token is consumed using a single conditional UPDATE query, so that only one of many
+        concurrent calls can succeed. A boolean indicating if the token has been consumed by the
+        current call is returned ; the action_token_consumed signal is only sent in that case. The
+        token instance can be passed in order to avoid fetching it again.
+        """
+        now = timezone.now()
+        with timed('token.consume'):
+            consumed = self.get_queryset().filter(
+                key=key, consumption_date__isnull=True, is_canceled=False, expires_at__gte=now,
+            ).update(
+                user=user, consumption_date=now, updated=now, status=self.model.STATUS_CONSUMED)
+        if not consumed:
+            incr('token.consume.conflict')
+            return False
+        invalidate_cached_tokens([key, ])
+
+        if token is None:
+            token = self.get(key=key)
+        else:
+            token.user = user
+            token.consumption_date = token.updated = now
+            token.status = self.model.STATUS_CONSUMED
+            token._refresh_initial_state()
+
+        signals.action_token_consumed.send(sender=token, instance=token, consumer=user)
+        return True
+
+    async def atry_consume(self, key, user, token=None):
+        """
+        Async version of try_consume.
+
+        The action is executed using the aexecute method of the related action (according to
+        its execution mode) and the action_token_consumed signal is then sent with
+        executed=True.
+        """
+        # The receivers module cannot be imported at the module level because it imports the
+        # models.
+        from .receivers import aexecute_action
+
+        now = timezone.now()
+        with timed('token.consume'):
+            consumed = await aupdate(
+                self.get_queryset().filter(
+                    key=key, consumption_date__isnull=True, is_canceled=False,
+                    expires_at__gte=now),
+                user=user, consumption_date=now, updated=now, status=self.model.STATUS_CONSUMED)
+        if not consumed:
+            incr('token.consume.conflict')
+            return False
+        await sync_to_async(invalidate_cached_tokens)([key, ])
+
+        if token is None:
+            token = await aget(self.get_queryset(), key=key)
+        else:
+            token.user = user
+            token.consumption_date = token.updated = now
+            token.status = self.model.STATUS_CONSUMED
+            token._refresh_initial_state()
+
+        action = actions.get_action(token.action)
+        if action:
+            await aexecute_action(action, token)
+        else:  # pragma: no cover
+            logger.warning(
+                'Unable to execute the action because the configuration of '
+                'the following action cannot be found: {}'.format(token.action))
+        await sync_to_async(signals.action_token_consumed.send)(
+            sender=token, instance=token, consumer=user, executed=True)
+        return True
+
+    def consume_many(self, keys, user):
+        """
+        Consumes the action tokens associated with the given keys for the given user and returns
+        a dictionary associating each key with a CONSUME_RESULT_* value.
+
+        The tokens are validated using a single query and the consumable ones are consumed using a
+        single conditional UPDATE query, so that tokens consumed concurrently by another call are
+        reported as already consumed. The action_tokens_consumed signal is then sent with all the
+        consumed tokens: the actions are executed once per action through their execute_many
+        method.
+        """
+        keys = list(OrderedDict.fromkeys(keys))
+        tokens = {token.key: token for token in self.get_queryset().filter(key__in=keys)}
+
+        results = OrderedDict()
+        consumable_tokens = []
+        for key in keys:
+            token = tokens.get(key)
+            if token is None:
+                results[key] = CONSUME_RESULT_NOT_FOUND
+            elif token.is_consumed:
+                results[key] = CONSUME_RESULT_ALREADY_CONSUMED
+            elif token.is_canceled:
+                results[key] = CONSUME_RESULT_CANCELED
+            elif token.is_expired:
+                results[key] = CONSUME_RESULT_EXPIRED
+            else:
+                action = actions.get_action(token.action)
+                if action and action.can_be_consumed(token, user):
+                    consumable_tokens.append(token)
+                else:
+                    results[key] = CONSUME_RESULT_FORBIDDEN
+        if not consumable_tokens:
+            return results
+
+        now = timezone.now()
+        consumable_pks = [token.pk for token in consumable_tokens]
+        with timed('token.consume_many'):
+            self.get_queryset().filter(
+                pk__in=consumable_pks, consumption_date__isnull=True, is_canceled=False,
+                expires_at__gte=now,
+            ).update(
+                user=user, consumption_date=now, updated=now, status=self.model.STATUS_CONSUMED)
+            # The tokens consumed by the current call are the ones carrying its consumption
+            # date.
+            consumed_pks = set(self.get_queryset().filter(
+                pk__in=consumable_pks, user=user, consumption_date=now,
+            ).values_list('pk', flat=True))
+
+        consumed_tokens = []
+        for token in consumable_tokens:
+            if token.pk not in consumed_pks:
+                results[token.key] = CONSUME_RESULT_ALREADY_CONSUMED
+                continue
+            token.user = user
+            token.consumption_date = token.updated = now
+            token.status = self.model.STATUS_CONSUMED
+            token._refresh_initial_state()
+            results[token.key] = CONSUME_RESULT_CONSUMED
+            consumed_tokens.append(token)
+        invalidate_cached_tokens([token.key for token in consumed_tokens])
+
+        if consumed_tokens:
+            signals.action_tokens_consumed.send(
+                sender=self.model, instances=consumed_tokens, consumer=user)
+
+        # The results are returned in the order of the keys.
+        return OrderedDict((key, results[key]) for key in keys)
+
+    def update_expired_statuses(self):
+        """
+        Flags the pending tokens whose expiration date is passed as expired and returns the
+        number of updated tokens.
+        """
+        return self.get_queryset().filter(
+            status=self.model.STATUS_PENDING, expires_at__lt=timezone.now(),
+        ).update(status=self.model.STATUS_EXPIRED)
+
+    def refresh_expiration_dates(self, chunk_size=None):
+        """
+        Recomputes the expiration dates of the pending and expired tokens from the validity
+        durations of their actions (eg. after the validity_duration of an action changed) and
+        updates their statuses accordingly. Returns the number of updated tokens.
+
+        The expiration dates of all the actions are computed by UPDATE queries using a CASE
+        expression on the action of the tokens. Tokens are updated by chunks of primary keys, each
+        chunk being updated in its own transaction in order to avoid holding locks for a long
+        time. The tokens of the actions that override get_expiration_date are left untouched.
+        """
+        chunk_size = chunk_size or account_actions_settings.EXPIRATION_REFRESH_CHUNK_SIZE
+        whens = []
+        custom_action_names = []
+        for entry in actions.get_entries():
+            if entry.has_custom_expiration_date:
+                custom_action_names.append(entry.action.name)
+            elif entry.validity_duration is not None:
+                whens.append(When(
+                    action=entry.action.name, then=F('created') + entry.validity_duration))
+        default_validity_duration = dt.timedelta(
+            days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
+
+        queryset = self.get_queryset().filter(
+            status__in=(self.model.STATUS_PENDING, self.model.STATUS_EXPIRED),
+        ).exclude(action__in=custom_action_names)
+        updated_count = 0
+        for pks in iter_pk_chunks(queryset, chunk_size):
+            chunk_queryset = queryset.filter(pk__in=pks)
+            with transaction.atomic(using=self.db):
+                updated_count += chunk_queryset.update(expires_at=Case(
+                    *whens, default=F('created') + default_validity_duration,
+                    output_field=DateTimeField()))
+                chunk_queryset.update(status=Case(
+                    When(expires_at__gte=timezone.now(), then=Value(self.model.STATUS_PENDING)),
+                    default=Value(self.model.STATUS_EXPIRED), output_field=CharField()))
+            invalidate_cached_tokens(chunk_queryset.values_list('key', flat=True))
+        return updated_count
+
+    def get_purgeable_queryset(self, retention_duration=None):
+        """
+        Returns a queryset of the expired, canceled and consumed tokens that were kept longer
+        than their retention duration.
+
+        The retention duration of a token (expressed as a number of days) is defined by the
+        ACCOUNT_ACTION_TOKEN_RETENTION_DURATIONS setting for its action, or by the
+        retention_duration argument (which defaults to ACCOUNT_ACTION_TOKEN_RETENTION_DURATION).
+        """
+        if retention_duration is None:
+            retention_duration = account_actions_settings.TOKEN_RETENTION_DURATION
+        now = timezone.now()
+
+        def _get_purgeable_filter(days):
+            dt_limit = now - dt.timedelta(days=days)
+            return Q(
+                status__in=(self.model.STATUS_PENDING, self.model.STATUS_EXPIRED),
+                expires_at__lt=dt_limit,
+            ) | Q(
+                status=self.model.STATUS_CANCELED, updated__lt=dt_limit,
+            ) | Q(
+                status=self.model.STATUS_CONSUMED, consumption_date__lt=dt_limit,
+            )
+
+        retention_durations = account_actions_settings.TOKEN_RETENTION_DURATIONS
+        purgeable_filter = ~Q(action__in=list(retention_durations)) \
+            & _get_purgeable_filter(retention_duration)
+        for action_name, days in retention_durations.items():
+            if days is not None:
+                purgeable_filter |= Q(action=action_name) & _get_purgeable_filter(days)
+        return self.get_queryset().filter(purgeable_filter)
+
+    def purge(self, retention_duration=None, chunk_size=None, callback=None):
+        """
+        Deletes the tokens returned by get_purgeable_queryset and returns the number of deleted
+        tokens.
+
+        Tokens are deleted by chunks of primary keys, each chunk being deleted in its own
+        transaction in order to avoid holding locks for a long time. The callback function (if
+        any) is called after each chunk with the number of tokens deleted so far.
+        """
+        chunk_size = chunk_size or account_actions_settings.PURGE_CHUNK_SIZE
+        deleted_count = 0
+        for pks in iter_pk_chunks(self.get_purgeable_queryset(retention_duration), chunk_size):
+            with transaction.atomic(using=self.db):
+                # The purge conditions are checked again in case tokens were updated after the
+                # retrieval of their primary keys.
+                queryset = self.get_purgeable_queryset(retention_duration).filter(pk__in=pks)
+                invalidate_cached_tokens(queryset.values_list('key', flat=True))
+                _, deleted = queryset.delete()
+            deleted_count += deleted.get(self.model._meta.label, 0)
+            if callback is not None:
+                callback(deleted_count)
+        return deleted_count
+
+    def send_notification_emails(self, tokens):
+        """
+        Sends the notification emails of the given tokens using the send_notification_emails
+        method of their actions (through the notification dispatcher).
+        """
+        tokens_per_action = OrderedDict()
+        for token in tokens:
+            tokens_per_action.setdefault(token.action, []).append(token)
+
+        for action_name, action_tokens in tokens_per_action.items():
+            entry = actions.get_entry(action_name)
+            if entry:
+                if entry.sends_notification_emails:
+                    get_notification_dispatcher().dispatch(
+                        entry.action.send_notification_emails, action_tokens)
+            else:
+                logger.warning(
+                    'Unable to send notification emails because the configuration of '
+                    'the following action cannot be found: {}'.format(action_name))
+
 
 class PendingManager(BaseAccountActionTokenManager):
     def get_queryset(self):
         """ Returns all the pending actions. """
-        dt_limit = timezone.now() - dt.timedelta(
-            days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
-
         qs = super(PendingManager, self).get_queryset()
-        qs = qs.filter(Q(
-            is_canceled=False) & Q(
-            user__isnull=True) & Q(
-            consumption_date__isnull=True) & Q(
-            created__gte=dt_limit))
+        # The columns from which the status is computed are filtered as well, because they can be
+        # updated without updating the status (eg. by QuerySet.update calls). The partial index
+        # covering the pending tokens is still used to perform this query.
+        qs = qs.filter(
+            status=self.model.STATUS_PENDING, is_canceled=False, consumption_date__isnull=True,
+            expires_at__gte=timezone.now())
         return qs
 
 
@@ -37,7 +395,66 @@ class ConsumedManager(BaseAccountActionTokenManager):
     def get_queryset(self):
         """ Returns all the consumed actions. """
         qs = super(ConsumedManager, self).get_queryset()
-        qs = qs.filter(
-            user__isnull=False, consumption_date__isnull=False)
+        # The consumption columns are filtered rather than the status, because they can be
+        # updated without updating the status (eg. by QuerySet.update calls).
+        qs = qs.filter(user__isnull=False, consumption_date__isnull=False)
 
         return qs
+
+
+class AccountActionExecutionManager(models.Manager):
+    def enqueue(self, token):
+        """
+        Schedules the background execution of the action associated with the given token. A
+        token can only be associated with one execution, so enqueuing the same token many times
+        has no effect.
+        """
+        execution, _ = self.get_or_create(token=token)
+        return execution
+
+    def run_due_executions(self, limit=None):
+        """
+        Runs the executions that are due and returns the number of executions that were run.
+
+        Each execution is claimed using a conditional UPDATE query before being run, so that
+        many workers can process the queue concurrently. A claim is only valid for
+        ``ACCOUNT_ACTION_EXECUTION_LEASE_DURATION`` seconds: running executions whose lease has
+        expired are considered as abandoned by their worker and are claimed again, which counts as
+        a failed attempt.
+        """
+        now = timezone.now()
+        pks = self.get_queryset() \
+            .filter(
+                status__in=(self.model.STATUS_PENDING, self.model.STATUS_RUNNING),
+                next_attempt_date__lte=now) \
+            .order_by('next_attempt_date').values_list('pk', flat=True)
+        if limit is not None:
+            pks = pks[:limit]
+
+        lease_duration = dt.timedelta(seconds=account_actions_settings.EXECUTION_LEASE_DURATION)
+        run_count = 0
+        for pk in list(pks):
+            now = timezone.now()
+            queryset = self.get_queryset().filter(pk=pk, next_attempt_date__lte=now)
+            claimed = queryset.filter(status=self.model.STATUS_PENDING).update(
+                status=self.model.STATUS_RUNNING, next_attempt_date=now + lease_duration,
+                updated=now)
+            is_stale = False
+            if not claimed:
+                # The worker that claimed this execution did not report its outcome before the end
+                # of its lease.
+                is_stale = claimed = queryset.filter(status=self.model.STATUS_RUNNING).update(
+                    attempts=F('attempts') + 1, last_error='The execution lease has expired.',
+                    next_attempt_date=now + lease_duration, updated=now)
+            if not claimed:
+                continue
+
+            execution = self.select_related('token').get(pk=pk)
+            if is_stale and \
+                    execution.attempts >= account_actions_settings.EXECUTION_MAX_ATTEMPTS:
+                execution.status = self.model.STATUS_FAILED
+                execution.save()
+                continue
+            execution.run()
+            run_count += 1
+        return run_count
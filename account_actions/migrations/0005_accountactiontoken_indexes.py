@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_actions', '0004_remove_accountactiontoken_active'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountactiontoken',
+            index=models.Index(condition=models.Q(('consumption_date__isnull', True), ('is_canceled', False), ('user__isnull', True)), fields=['created'], name='account_act_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountactiontoken',
+            index=models.Index(fields=['content_type', 'object_id'], name='account_act_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='accountactiontoken',
+            index=models.Index(fields=['action', 'created'], name='account_act_action_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+import datetime as dt
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def fill_expires_at_and_status(apps, schema_editor):
+    Token = apps.get_model('account_actions', 'AccountActionToken')
+    validity_duration = getattr(settings, 'ACCOUNT_ACTION_TOKEN_VALIDITY_DURATION', 10)
+    Token.objects.update(expires_at=models.F('created') + dt.timedelta(days=validity_duration))
+    Token.objects.update(status=models.Case(
+        models.When(
+            consumption_date__isnull=False, user__isnull=False, then=models.Value('consumed')),
+        models.When(is_canceled=True, then=models.Value('canceled')),
+        models.When(
+            expires_at__lt=django.utils.timezone.now(), then=models.Value('expired')),
+        default=models.Value('pending'), output_field=models.CharField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_actions', '0005_accountactiontoken_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='accountactiontoken',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Creation date'),
+        ),
+        migrations.AddField(
+            model_name='accountactiontoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Expiration date'),
+        ),
+        migrations.AddField(
+            model_name='accountactiontoken',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('consumed', 'Consumed'), ('canceled', 'Canceled'), ('expired', 'Expired')], default='pending', editable=False, max_length=10, verbose_name='Status'),
+        ),
+        migrations.RunPython(fill_expires_at_and_status, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='accountactiontoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, verbose_name='Expiration date'),
+        ),
+        migrations.RemoveIndex(
+            model_name='accountactiontoken',
+            name='account_act_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='accountactiontoken',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['expires_at'], name='account_act_pending_exp_idx'),
+        ),
+    ]
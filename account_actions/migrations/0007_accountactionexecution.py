@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_actions', '0006_accountactiontoken_expires_at_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountActionExecution',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Update date')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt date')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+                ('token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='execution', to='account_actions.accountactiontoken', verbose_name='Account action token')),
+            ],
+            options={
+                'verbose_name': 'Account action execution',
+                'verbose_name_plural': 'Account action executions',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='accountactionexecution',
+            index=models.Index(fields=['status', 'next_attempt_date'], name='account_act_exec_due_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:51
+
+from django.db import migrations, models
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account_actions', '0007_accountactionexecution'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='accountactiontoken',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='account_act_email_lower_idx'),
+        ),
+    ]
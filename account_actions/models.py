@@ -2,31 +2,68 @@
 
 from __future__ import unicode_literals
 import datetime as dt
+import logging
+import traceback
 
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
+from django.db import transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from . import signals
+from .action_pool import actions
+from .cache import invalidate_cached_tokens
 from .conf import settings as account_actions_settings
 from .core.key import gen_action_key
+from .exceptions import ExecutionClaimLost
+from .instrumentation import timed
+from .managers import AccountActionExecutionManager
+from .managers import AccountActionTokenManager
 from .managers import ConsumedManager
 from .managers import PendingManager
 
+logger = logging.getLogger(__name__)
+
 
 class AccountActionToken(models.Model):
     """
     Defines an action that can be performed by a single user in a limited period of time.
     """
-    created = models.DateTimeField(auto_now_add=True, verbose_name=_('Creation date'))
+    STATUS_PENDING = 'pending'
+    STATUS_CONSUMED = 'consumed'
+    STATUS_CANCELED = 'canceled'
+    STATUS_EXPIRED = 'expired'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_CONSUMED, _('Consumed')),
+        (STATUS_CANCELED, _('Canceled')),
+        (STATUS_EXPIRED, _('Expired')),
+    )
+
+    created = models.DateTimeField(
+        default=timezone.now, editable=False, verbose_name=_('Creation date'))
     updated = models.DateTimeField(auto_now=True, verbose_name=_('Update date'))
 
+    # The expiration date is computed from the creation date when the token is saved for the
+    # first time (see AccountActionBase.get_expiration_date).
+    expires_at = models.DateTimeField(
+        verbose_name=_('Expiration date'), blank=True, db_index=True)
+
     # An account action token can be canceled.
     is_canceled = models.BooleanField(verbose_name=_('Canceled'), default=False)
 
+    # The status of the token is denormalized from the other fields of the token on each save so
+    # that tokens can be filtered using indexed columns. Note that pending tokens are only
+    # flagged as expired when they are saved (or when the expired statuses are updated using
+    # the AccountActionTokenManager.update_expired_statuses method).
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, editable=False,
+        verbose_name=_('Status'))
+
     # The 'user' foreign key should be filled only when the action token is consumed.
     consumption_date = models.DateTimeField(
         verbose_name=_('Consumption date'), blank=True, null=True)
@@ -55,13 +92,26 @@ class AccountActionToken(models.Model):
     object_id = models.PositiveIntegerField(blank=True, null=True)
     content_object = GenericForeignKey('content_type', 'object_id')
 
-    objects = models.Manager()
+    objects = AccountActionTokenManager()
     consumed_objects = ConsumedManager()
     pending_objects = PendingManager()
 
     class Meta:
         verbose_name = _('Account action token')
         verbose_name_plural = _('Account action tokens')
+        indexes = [
+            # Partial index covering the pending tokens (on backends supporting partial indexes).
+            models.Index(
+                fields=['expires_at', ], name='account_act_pending_exp_idx',
+                condition=models.Q(status='pending')),
+            models.Index(fields=['content_type', 'object_id', ], name='account_act_object_idx'),
+            models.Index(fields=['action', 'created', ], name='account_act_action_idx'),
+            models.Index(Lower('email'), name='account_act_email_lower_idx'),
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super(AccountActionToken, self).__init__(*args, **kwargs)
+        self._initial_state = self._get_tracked_state()
 
     def __str__(self):
         return '{0} - {1}'.format(self.created, self.action)
@@ -69,26 +119,127 @@ class AccountActionToken(models.Model):
     def cancel(self):
         """ Cancels the token. """
         self.is_canceled = True
-        self.save()
+        self._save_changes(['is_canceled', ])
 
     def consume(self, user):
         """ Consumes the token for the given user. """
-        self.user = user
-        self.consumption_date = timezone.now()
-        self.save()
+        with timed('token.consume', action=self.action):
+            self.user = user
+            self.consumption_date = timezone.now()
+            self._save_changes(['user', 'consumption_date', ])
+
+    @classmethod
+    def get_status_expression(cls, is_canceled=None):
+        """
+        Returns an expression that computes the status of tokens from their other columns. It
+        can be used to keep statuses in sync in UPDATE queries ; the is_canceled argument allows
+        to compute the status using the canceled state being set by the query.
+        """
+        whens = [
+            models.When(
+                consumption_date__isnull=False, user__isnull=False,
+                then=models.Value(cls.STATUS_CONSUMED)),
+        ]
+        if is_canceled is None:
+            whens.append(models.When(is_canceled=True, then=models.Value(cls.STATUS_CANCELED)))
+        elif is_canceled:
+            return models.Case(
+                *whens, default=models.Value(cls.STATUS_CANCELED),
+                output_field=models.CharField())
+        whens.append(
+            models.When(expires_at__lt=timezone.now(), then=models.Value(cls.STATUS_EXPIRED)))
+        return models.Case(
+            *whens, default=models.Value(cls.STATUS_PENDING), output_field=models.CharField())
+
+    def get_changed_fields(self):
+        """ Returns the names of the concrete fields whose values changed since the last save. """
+        state = self._get_tracked_state()
+        return [
+            field.name for field in self._meta.concrete_fields
+            if self._initial_state.get(field.attname) != state[field.attname]]
 
     def save(self, *args, **kwargs):
-        creation = self.pk is None
+        """
+        Saves the token. When only_changed is True, only the fields whose values changed since
+        the token was loaded (or last saved) are written by the UPDATE query.
+        """
+        only_changed = kwargs.pop('only_changed', False)
+        creation = self._state.adding
         if creation and not self.key:
             self.key = gen_action_key()
+        if only_changed and not creation and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = self.get_changed_fields() + ['updated', ]
+        self.update_denormalized_fields()
 
-        old_instance = self.__class__._default_manager.get(pk=self.pk) if self.pk else None
-        super(AccountActionToken, self).save(*args, **kwargs)
+        # The denormalized fields must be written along with any other field.
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'expires_at', 'status', }
+
+        was_consumed = self._initial_state['consumption_date'] is not None \
+            and self._initial_state['user_id'] is not None
+        with timed('token.issue' if creation else 'token.save', action=self.action):
+            super(AccountActionToken, self).save(*args, **kwargs)
+        self._refresh_initial_state(kwargs.get('update_fields'))
+        invalidate_cached_tokens([self.key, ])
 
         # Triggers a signal indicating that the action token has been consumed.
-        if old_instance and not old_instance.is_consumed and self.is_consumed:
+        if not creation and not was_consumed and self.is_consumed:
             signals.action_token_consumed.send(sender=self, instance=self, consumer=self.user)
 
+    def delete(self, *args, **kwargs):
+        invalidate_cached_tokens([self.key, ])
+        return super(AccountActionToken, self).delete(*args, **kwargs)
+
+    def update_denormalized_fields(self):
+        """
+        Updates the expiration date (if it is not set or if the creation date changed) and the
+        status of the token.
+        """
+        created_changed = self.created != self._initial_state['created']
+        expires_at_changed = self.expires_at != self._initial_state['expires_at']
+        if self.expires_at is None or (created_changed and not expires_at_changed):
+            action = actions.get_action(self.action)
+            self.expires_at = action.get_expiration_date(self) if action \
+                else self.created + dt.timedelta(
+                    days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
+
+        if self.is_consumed:
+            self.status = self.STATUS_CONSUMED
+        elif self.is_canceled:
+            self.status = self.STATUS_CANCELED
+        elif self.is_expired:
+            self.status = self.STATUS_EXPIRED
+        else:
+            self.status = self.STATUS_PENDING
+
+    def refresh_from_db(self, using=None, fields=None):
+        super(AccountActionToken, self).refresh_from_db(using=using, fields=fields)
+        self._refresh_initial_state(fields)
+
+    def _get_tracked_state(self):
+        # The initial values of the concrete fields are tracked in order to detect state changes
+        # on save. Deferred fields are not part of the instance's __dict__ ; they are not fetched
+        # here.
+        return {
+            field.attname: self.__dict__.get(field.attname)
+            for field in self._meta.concrete_fields}
+
+    def _refresh_initial_state(self, update_fields=None):
+        state = self._get_tracked_state()
+        if update_fields is not None:
+            update_fields = {self._meta.get_field(name).attname for name in update_fields}
+            state = {
+                name: value if name in update_fields else self._initial_state.get(name)
+                for name, value in state.items()}
+        self._initial_state = state
+
+    def _save_changes(self, fields):
+        # Only the given fields (and the update date) are written when the token already exists.
+        if self._state.adding:
+            self.save()
+        else:
+            self.save(update_fields=fields + ['updated', ])
+
     @property
     def can_be_consumed(self):
         """ Returns a boolean indicating if the action can be consumed. """
@@ -97,15 +248,111 @@ class AccountActionToken(models.Model):
     @property
     def expiration_date(self):
         """ Returns the expiration date of the action token. """
+        if self.expires_at is not None:
+            return self.expires_at
         return self.created + dt.timedelta(
             days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
 
     @property
     def is_consumed(self):
         """ Returns a boolean indicating if the action token has been consumed. """
-        return self.consumption_date is not None and self.user is not None
+        return self.consumption_date is not None and self.user_id is not None
 
     @property
     def is_expired(self):
         """ Returns a boolean indicating if the action token has expired. """
         return timezone.now() > self.expiration_date
+
+
+class AccountActionExecution(models.Model):
+    """
+    Defines the execution of the action associated with a consumed token, when this action is
+    executed in the background.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_FAILED, _('Failed')),
+    )
+
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_('Creation date'))
+    updated = models.DateTimeField(auto_now=True, verbose_name=_('Update date'))
+
+    # A token can only be associated with one execution: this ensures that the action of a token
+    # cannot be executed twice.
+    token = models.OneToOneField(
+        AccountActionToken, verbose_name=_('Account action token'), related_name='execution',
+        on_delete=models.CASCADE)
+
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name=_('Status'))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_('Attempts'))
+    next_attempt_date = models.DateTimeField(
+        default=timezone.now, verbose_name=_('Next attempt date'))
+    last_error = models.TextField(blank=True, verbose_name=_('Last error'))
+
+    objects = AccountActionExecutionManager()
+
+    class Meta:
+        verbose_name = _('Account action execution')
+        verbose_name_plural = _('Account action executions')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_date', ], name='account_act_exec_due_idx'),
+        ]
+
+    def __str__(self):
+        return '{0} - {1}'.format(self.token, self.get_status_display())
+
+    def run(self):
+        """
+        Executes the action associated with the token. The execution is flagged as done in the
+        same transaction as the one used to execute the action. Failed executions are retried
+        with an exponential backoff until the maximum number of attempts is reached.
+
+        The outcome of the execution is saved using a conditional UPDATE query, which only
+        succeeds if the execution was not claimed again in the meantime (eg. by another worker
+        once the lease of the current one expired). Otherwise the outcome is discarded and the
+        database writes of the action are rolled back, so that the action of a token is never
+        executed twice.
+        """
+        claim_queryset = self.__class__._default_manager.filter(
+            pk=self.pk, status=self.status, attempts=self.attempts)
+        self.attempts += 1
+        claimed = True
+        try:
+            with transaction.atomic():
+                with timed('action.execute', action=self.token.action):
+                    actions.get_action_or_raise(self.token.action).execute(self.token)
+                self.status = self.STATUS_DONE
+                self.last_error = ''
+                if not self._save_outcome(claim_queryset):
+                    raise ExecutionClaimLost
+        except ExecutionClaimLost:
+            claimed = False
+        except Exception:
+            logger.exception('Unable to execute the action of the token {}'.format(self.token.pk))
+            self.last_error = traceback.format_exc()
+            if self.attempts >= account_actions_settings.EXECUTION_MAX_ATTEMPTS:
+                self.status = self.STATUS_FAILED
+            else:
+                self.status = self.STATUS_PENDING
+                retry_delay = account_actions_settings.EXECUTION_RETRY_DELAY \
+                    * 2 ** (self.attempts - 1)
+                self.next_attempt_date = timezone.now() + dt.timedelta(seconds=retry_delay)
+            claimed = self._save_outcome(claim_queryset)
+        if not claimed:
+            logger.warning(
+                'The execution of the action of the token {} was claimed again: its outcome is '
+                'discarded'.format(self.token.pk))
+
+    def _save_outcome(self, claim_queryset):
+        # Returns a boolean indicating if the execution was still claimed by the current run.
+        self.updated = timezone.now()
+        return bool(claim_queryset.update(
+            status=self.status, attempts=self.attempts, last_error=self.last_error,
+            next_attempt_date=self.next_attempt_date, updated=self.updated))
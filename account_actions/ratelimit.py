@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from .conf import settings as account_actions_settings
+
+
+class BaseRateLimiter(object):
+    """
+    Rate limiters are used by the generic views to limit the number of action token lookups that
+    can be performed by a client before querying the database.
+    """
+    def is_allowed(self, request, key):
+        """ Returns a boolean indicating if the given key can be looked up for the request. """
+        raise NotImplementedError
+
+
+class NoRateLimiter(BaseRateLimiter):
+    """ Allows all the lookups. """
+    def is_allowed(self, request, key):
+        return True
+
+
+class CacheRateLimiter(BaseRateLimiter):
+    """
+    Limits the number of lookups per client IP address and per key during fixed time windows
+    (expressed in seconds). The counters are stored in a Django cache.
+    """
+    def __init__(
+            self, cache='default', rate_per_ip=60, rate_per_key=10, period=60,
+            ip_meta_key='REMOTE_ADDR'):
+        self.cache = cache
+        self.rate_per_ip = rate_per_ip
+        self.rate_per_key = rate_per_key
+        self.period = period
+        self.ip_meta_key = ip_meta_key
+
+    def get_client_ip(self, request):
+        # Headers such as X-Forwarded-For can contain many comma-separated addresses: the first
+        # one is the address of the client.
+        return request.META.get(self.ip_meta_key, '').split(',')[0].strip()
+
+    def is_allowed(self, request, key):
+        window = int(time.time() // self.period)
+        limits = []
+        if self.rate_per_ip:
+            limits.append(('ip', self.get_client_ip(request), self.rate_per_ip))
+        if self.rate_per_key:
+            limits.append(('key', key, self.rate_per_key))
+
+        allowed = True
+        for scope, value, rate in limits:
+            if self._incr(scope, value, window) > rate:
+                allowed = False
+        return allowed
+
+    def _incr(self, scope, value, window):
+        cache = caches[self.cache]
+        cache_key = 'account_actions:ratelimit:{}:{}:{}'.format(
+            scope, hashlib.md5(value.encode('utf-8')).hexdigest(), window)
+        cache.add(cache_key, 0, timeout=self.period)
+        try:
+            return cache.incr(cache_key)
+        except ValueError:
+            # The counter was evicted in the meantime.
+            cache.set(cache_key, 1, timeout=self.period)
+            return 1
+
+
+RATE_LIMITERS = {
+    'none': NoRateLimiter,
+    'cache': CacheRateLimiter,
+}
+
+_rate_limiter = None
+_rate_limiter_config = None
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter used by the generic views, as configured by the
+    ACCOUNT_ACTION_RATE_LIMITER and ACCOUNT_ACTION_RATE_LIMITER_OPTIONS settings.
+    """
+    global _rate_limiter, _rate_limiter_config
+    config = (
+        account_actions_settings.RATE_LIMITER,
+        account_actions_settings.RATE_LIMITER_OPTIONS, )
+    if _rate_limiter is None or config != _rate_limiter_config:
+        rate_limiter_class = RATE_LIMITERS.get(config[0]) or import_string(config[0])
+        _rate_limiter = rate_limiter_class(**config[1])
+        _rate_limiter_config = config
+    return _rate_limiter
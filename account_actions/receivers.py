@@ -1,13 +1,24 @@
 # -*- coding: utf-8 -*-
 
+from collections import OrderedDict
 import logging
 
+from asgiref.sync import sync_to_async
+
+from django.db import transaction
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .action_base import EXECUTION_MODE_BACKGROUND
+from .action_base import EXECUTION_MODE_ON_COMMIT
 from .action_pool import actions
+from .conf import settings as account_actions_settings
+from .dispatchers import get_notification_dispatcher
+from .instrumentation import timed
+from .models import AccountActionExecution
 from .models import AccountActionToken
 from .signals import action_token_consumed
+from .signals import action_tokens_consumed
 
 logger = logging.getLogger(__name__)
 
@@ -16,21 +27,99 @@ logger = logging.getLogger(__name__)
 def send_creation_notification_email(sender, instance, *args, **kwargs):
     created = kwargs.get('created')
     if created:
-        action = actions.get_action(instance.action)
-        if action:
-            action.send_notification_email(instance)
-        else:  # pragma: no cover
+        entry = actions.get_entry(instance.action)
+        if entry is None:  # pragma: no cover
             logger.warning(
                 'Unable to send a notification email because the configuration of '
-                'the following action cannot be found: {}'.format(instance.action), exc_info=True)
+                'the following action cannot be found: {}'.format(instance.action))
+        elif entry.sends_notification_emails:
+            # Actions that do not override the notification hooks never send emails.
+            with timed('notification.dispatch', action=instance.action):
+                get_notification_dispatcher().dispatch(
+                    entry.action.send_notification_email, instance)
+
+
+def _execute(action, token):
+    with timed('action.execute', action=action.name):
+        action.execute(token)
+
+
+def _execute_many(action, tokens):
+    with timed('action.execute_many', action=action.name):
+        action.execute_many(tokens)
+
+
+def execute_actions(action, tokens):
+    """
+    Executes the given action for the given consumed tokens according to its execution mode.
+    """
+    if action.execution_mode == EXECUTION_MODE_BACKGROUND:
+        for token in tokens:
+            AccountActionExecution.objects.enqueue(token)
+    elif action.execution_mode == EXECUTION_MODE_ON_COMMIT:
+        transaction.on_commit(lambda: _execute_many(action, tokens))
+    else:
+        _execute_many(action, tokens)
+
+
+async def aexecute_action(action, token):
+    """
+    Executes the given action for the given consumed token according to its execution mode,
+    using the aexecute method of the action for inline executions.
+    """
+    if action.execution_mode == EXECUTION_MODE_BACKGROUND:
+        await sync_to_async(AccountActionExecution.objects.enqueue)(token)
+    elif action.execution_mode == EXECUTION_MODE_ON_COMMIT:
+        await sync_to_async(transaction.on_commit)(lambda: _execute(action, token))
+    else:
+        with timed('action.execute', action=action.name):
+            await action.aexecute(token)
 
 
 @receiver(action_token_consumed)
 def execute_action(sender, instance, consumer, **kwargs):
+    if kwargs.get('batched') or kwargs.get('executed'):
+        # The action was already executed for the whole batch of consumed tokens or by the
+        # async code path.
+        return
     action = actions.get_action(instance.action)
     if action:
-        action.execute(instance)
+        if action.execution_mode == EXECUTION_MODE_BACKGROUND:
+            AccountActionExecution.objects.enqueue(instance)
+        elif action.execution_mode == EXECUTION_MODE_ON_COMMIT:
+            transaction.on_commit(lambda: _execute(action, instance))
+        else:
+            _execute(action, instance)
     else:  # pragma: no cover
         logger.warning(
             'Unable to execute the action because the configuration of '
-            'the following action cannot be found: {}'.format(instance.action), exc_info=True)
+            'the following action cannot be found: {}'.format(instance.action))
+
+
+@receiver(action_tokens_consumed)
+def execute_actions_in_batch(sender, instances, consumer, **kwargs):
+    tokens_per_action = OrderedDict()
+    for instance in instances:
+        tokens_per_action.setdefault(instance.action, []).append(instance)
+
+    for action_name, tokens in tokens_per_action.items():
+        action = actions.get_action(action_name)
+        if action:
+            execute_actions(action, tokens)
+        else:  # pragma: no cover
+            logger.warning(
+                'Unable to execute the action because the configuration of '
+                'the following action cannot be found: {}'.format(action_name))
+
+
+@receiver(action_tokens_consumed)
+def fan_out_consumed_signal(sender, instances, consumer, **kwargs):
+    """
+    Sends the action_token_consumed signal for each consumed token so that the receivers that
+    do not handle batches of tokens are still notified.
+    """
+    if not account_actions_settings.FAN_OUT_CONSUMED_SIGNAL:
+        return
+    for instance in instances:
+        action_token_consumed.send(
+            sender=instance, instance=instance, consumer=consumer, batched=True)
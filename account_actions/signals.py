@@ -4,3 +4,8 @@ import django.dispatch
 
 
 action_token_consumed = django.dispatch.Signal()
+
+# Sent once with the list of the consumed tokens ("instances") when many tokens are consumed at
+# once. By default the action_token_consumed signal is also sent for each of these tokens (with
+# batched=True).
+action_tokens_consumed = django.dispatch.Signal()
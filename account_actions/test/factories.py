@@ -3,6 +3,7 @@
 import datetime as dt
 import factory
 from faker import Factory
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 from ..core.key import gen_action_key
@@ -26,10 +27,55 @@ class AccountActionTokenFactory(factory.django.DjangoModelFactory):
 
 
 class ExpiredAccountActionTokenFactory(AccountActionTokenFactory):
+    created = factory.LazyFunction(
+        lambda: timezone.now() - dt.timedelta(days=ACTION_TOKEN_VALIDITY_DURATION + 1))
 
-    @factory.post_generation
-    def post(obj, create, extracted, **kwargs):
-        obj._meta.get_field('created').auto_now_add = False
-        obj.created = timezone.now() - dt.timedelta(days=ACTION_TOKEN_VALIDITY_DURATION + 1)
-        obj.save()
-        obj._meta.get_field('created').auto_now_add = True
+
+def bulk_create_tokens(
+        size, states=None, created=None, users=None, batch_size=5000,
+        factory_class=AccountActionTokenFactory, **kwargs):
+    """
+    Creates many action tokens (eg. for load tests) using batched INSERT queries and returns the
+    number of created tokens. No signals are sent and no notification emails are sent.
+
+    The states argument is a dictionary associating the states of the tokens ('pending',
+    'consumed', 'canceled' and 'expired') with their proportions (all the tokens are pending by
+    default). The created argument can be a datetime or a function returning the creation date of
+    the n-th token (note that pending tokens created before their validity duration are expired).
+    Consumed tokens are associated with the given users (a user is created if
+    needed). The other keyword arguments are passed to the build_batch method of factory_class.
+    """
+    states = states or {AccountActionToken.STATUS_PENDING: 1}
+    total_weight = float(sum(states.values()))
+    state_limits = []
+    limit = 0
+    for state, weight in states.items():
+        limit += weight / total_weight
+        state_limits.append((limit, state))
+
+    if AccountActionToken.STATUS_CONSUMED in states and not users:
+        users = [get_user_model().objects.get_or_create(username='account-actions-seed')[0]]
+
+    now = timezone.now()
+    expired_created = now - dt.timedelta(days=ACTION_TOKEN_VALIDITY_DURATION + 1)
+    for offset in range(0, size, batch_size):
+        tokens = factory_class.build_batch(min(batch_size, size - offset), **kwargs)
+        for i, token in enumerate(tokens, offset):
+            # The states are interleaved using a low-discrepancy sequence, so that any range of
+            # tokens contains the expected proportions of states.
+            position = (i * 0.6180339887498949) % 1
+            state = next(
+                (s for limit, s in state_limits if position < limit), state_limits[-1][1])
+
+            token.created = created(i) if callable(created) else created or (
+                expired_created if state == AccountActionToken.STATUS_EXPIRED else now)
+            if state == AccountActionToken.STATUS_CONSUMED:
+                token.user = users[i % len(users)]
+                token.consumption_date = token.created
+            elif state == AccountActionToken.STATUS_CANCELED:
+                token.is_canceled = True
+            elif state == AccountActionToken.STATUS_EXPIRED:
+                token.update_denormalized_fields()
+                token.expires_at = min(token.expires_at, now - dt.timedelta(seconds=1))
+        AccountActionToken.objects.bulk_issue(tokens, batch_size=batch_size, notify=False)
+    return size
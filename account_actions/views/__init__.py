@@ -2,3 +2,4 @@
 
 
 from .generic import *  # noqa
+from .asynchronous import *  # noqa
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.http import HttpResponseRedirect
+
+from ..cache import get_cached_token
+from ..core.compat import aget
+from ..core.compat import aget_user
+from ..core.compat import markcoroutinefunction
+from ..instrumentation import incr
+from ..instrumentation import timed
+from .generic import AccountActionConsumeView
+from .generic import AccountActionLandingView
+from .generic import AccountActionTokenMixin
+
+
+class AsyncAccountActionTokenMixin(AccountActionTokenMixin):
+    """
+    Provides the async versions of the methods of AccountActionTokenMixin. Views using this mixin
+    must define async handlers: they are served without thread switches by ASGI servers.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super(AsyncAccountActionTokenMixin, cls).as_view(**initkwargs)
+        # Django versions prior to 4.1 do not detect async class-based views.
+        return markcoroutinefunction(view)
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await self.acheck_request(request, kwargs.get(self.key_url_kwargs))
+        if response is not None:
+            return response
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        else:
+            handler = self.http_method_not_allowed
+        response = handler(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+    async def acheck_request(self, request, key):
+        """ Async version of check_request.
+
+        The checks of check_request can perform blocking I/O (cache queries of the rate limiter,
+        discovery of the actions), so they are run in a thread rather than on the event loop.
+        """
+        return await sync_to_async(self.check_request)(request, key)
+
+    async def aget_context_data(self, **kwargs):
+        # The context provided by AccountActionTokenMixin is built using the async hooks of the
+        # action.
+        context = super(AccountActionTokenMixin, self).get_context_data(**kwargs)
+        context['action'] = self.action
+        user = await aget_user(self.request)
+        context.update(await self.action.aget_extra_context(self.object, user))
+        return context
+
+    async def aget_object(self, queryset=None):
+        """ Async version of get_object.
+
+        Once this method has been called, the token and the action of the view (get_object and
+        the action property) can be used without querying the database.
+        """
+        use_default_queryset = queryset is None
+        if use_default_queryset:
+            if '_token' in self.__dict__:
+                return self._token
+            queryset = self.get_queryset()
+
+        key = self.kwargs.get(self.key_url_kwargs)
+
+        try:
+            with timed('token.lookup'):
+                if use_default_queryset and self.use_token_cache:
+                    obj = await sync_to_async(get_cached_token)(key, queryset)
+                else:
+                    obj = await aget(queryset.filter(key=key))
+        except queryset.model.DoesNotExist:
+            incr('token.lookup.miss')
+            raise Http404
+
+        if use_default_queryset:
+            self._token = obj
+        return obj
+
+
+class AsyncAccountActionLandingView(AsyncAccountActionTokenMixin, AccountActionLandingView):
+    """
+    Async version of AccountActionLandingView.
+    """
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        context = await self.aget_context_data(object=self.object)
+        return self.render_to_response(context)
+
+
+class AsyncAccountActionConsumeView(AsyncAccountActionTokenMixin, AccountActionConsumeView):
+    """
+    Async version of AccountActionConsumeView.
+    """
+    async def ahas_permission(self):
+        user = await aget_user(self.request)
+        if not user.is_authenticated:
+            return False
+        token = await self.aget_object()
+        return await self.action.acan_be_consumed(token, user)
+
+    async def post(self, request, *args, **kwargs):
+        if not await self.ahas_permission():
+            raise PermissionDenied
+        self.object = await self.aget_object()
+        # The token is consumed using a conditional UPDATE query: if another request consumed
+        # it in the meantime, the action must not be executed twice.
+        consumed = await self.model.objects.atry_consume(
+            self.object.key, request.user, token=self.object)
+        if not consumed:
+            raise PermissionDenied
+        # The redirect URL and the success message of the action can be computed using the ORM
+        # (eg. from the content object of the token).
+        return HttpResponseRedirect(await sync_to_async(self.get_redirect_url)())
@@ -2,28 +2,80 @@
 
 from __future__ import unicode_literals
 
+from collections import OrderedDict
+import datetime as dt
 import logging
 
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
 from django.http import HttpResponseRedirect
 from django.utils.functional import cached_property
+from django.utils.translation import ngettext
 from django.views.generic import View
 from django.views.generic.detail import SingleObjectMixin
 from django.views.generic.detail import SingleObjectTemplateResponseMixin
 
 from ..action_pool import actions
+from ..cache import get_cached_token
+from ..conf import settings as account_actions_settings
+from ..core.key import check_signed_action_key
+from ..core.key import is_signed_action_key
+from ..core.key import is_valid_action_key
+from ..exceptions import ActionNotRegistered
+from ..instrumentation import incr
+from ..instrumentation import timed
+from ..managers import CONSUME_RESULT_CONSUMED
+from ..managers import CONSUME_RESULT_NOT_FOUND
 from ..models import AccountActionToken
+from ..ratelimit import get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
 
-class AccountActionTokenMixin(SingleObjectMixin):
+class AccountActionKeyMixin(object):
+    """
+    Provides the checks that allow to reject the values that cannot be associated with action
+    tokens before querying the database.
+    """
+    def check_key(self, key):
+        """ Returns a boolean indicating if the given key can be associated with a token.
+
+        Values that do not have the shape of an action key are rejected, as well as signed keys
+        that are forged or older than the signed key max age.
+        """
+        if not is_valid_action_key(key):
+            return False
+        if is_signed_action_key(key):
+            return check_signed_action_key(key, max_age=self.get_signed_key_max_age())
+        return True
+
+    def get_signed_key_max_age(self):
+        """ Returns the timedelta after which signed keys are rejected (or None). """
+        max_age = account_actions_settings.SIGNED_KEY_MAX_AGE
+        if max_age is None:
+            max_age = dt.timedelta(days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
+            for entry in actions.get_entries():
+                if entry.has_custom_expiration_date:
+                    # The validity duration of the tokens of the action cannot be known.
+                    return None
+                if entry.validity_duration is not None:
+                    max_age = max(max_age, entry.validity_duration)
+            return max_age
+        return dt.timedelta(days=max_age)
+
+
+class AccountActionTokenMixin(AccountActionKeyMixin, SingleObjectMixin):
     context_object_name = 'token'
     key_url_kwargs = 'key'
     model = AccountActionToken
 
+    # Indicates if the token can be retrieved from the cache defined by the
+    # ACCOUNT_ACTION_TOKEN_CACHE setting.
+    use_token_cache = False
+
     def get_context_data(self, **kwargs):
         context = super(AccountActionTokenMixin, self).get_context_data(**kwargs)
         context['action'] = self.action
@@ -35,30 +87,67 @@ class AccountActionTokenMixin(SingleObjectMixin):
 
         If no actions can be found, an HTTP 404 error is returned.
         """
-        action = actions.get_action(self.get_object().action)
-        if not action:
+        token = self.get_object()
+        try:
+            return actions.get_action_or_raise(token.action)
+        except ActionNotRegistered:
             logger.error(
-                'Unable to find the following action: {}'.format(self.object.action),
+                'Unable to find the following action: {}'.format(token.action),
                 exc_info=True, extra={'request': self.request, })
             # If the action is not configured, we should raise an HTTP 404 error because no action
             # can be executed for the current token.
             raise Http404
-        return action
+
+    def dispatch(self, request, *args, **kwargs):
+        response = self.check_request(request, kwargs.get(self.key_url_kwargs))
+        if response is not None:
+            return response
+        return super(AccountActionTokenMixin, self).dispatch(request, *args, **kwargs)
+
+    def check_request(self, request, key):
+        """ Rejects invalid keys and rate limited requests before querying the database.
+
+        An HTTP 404 error is raised for invalid keys and an HTTP 429 response is returned for
+        rate limited requests.
+        """
+        if not self.check_key(key):
+            incr('token.lookup.rejected')
+            raise Http404
+        if not get_rate_limiter().is_allowed(request, key):
+            incr('token.lookup.rate_limited')
+            return HttpResponse(status=429)
 
     def get_object(self, queryset=None):
-        if queryset is None:  # pragma: no cover
+        """ Returns the token associated with the key of the URL.
+
+        The token is fetched only once per request when the default queryset is used.
+        """
+        use_default_queryset = queryset is None
+        if use_default_queryset:
+            if '_token' in self.__dict__:
+                return self._token
             queryset = self.get_queryset()
 
         key = self.kwargs.get(self.key_url_kwargs)
-        queryset = queryset.filter(key=key)
 
         try:
-            obj = queryset.get()
+            with timed('token.lookup'):
+                if use_default_queryset and self.use_token_cache:
+                    obj = get_cached_token(key, queryset)
+                else:
+                    obj = queryset.filter(key=key).get()
         except queryset.model.DoesNotExist:
+            incr('token.lookup.miss')
             raise Http404
 
+        if use_default_queryset:
+            self._token = obj
         return obj
 
+    def get_queryset(self):
+        return super(AccountActionTokenMixin, self).get_queryset() \
+            .select_related('user', 'content_type')
+
     def get_token(self):
         return self.get_object()
 
@@ -71,6 +160,7 @@ class AccountActionLandingView(AccountActionTokenMixin, SingleObjectTemplateResp
     This views provides a "landing" page in order to consume an action.
     """
     http_method_names = ['get', ]
+    use_token_cache = True
 
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -90,11 +180,6 @@ class AccountActionConsumeView(AccountActionTokenMixin, View):
     """
     http_method_names = ['post', ]
 
-    def dispatch(self, request, *args, **kwargs):
-        if not self.has_permission():
-            raise PermissionDenied
-        return super(AccountActionConsumeView, self).dispatch(request, *args, **kwargs)
-
     def get_redirect_url(self):
         messages.success(
             self.request, self.action.get_consumption_success_message(self.object))
@@ -105,7 +190,79 @@ class AccountActionConsumeView(AccountActionTokenMixin, View):
             and self.action.can_be_consumed(self.get_object(), self.request.user)
 
     def post(self, request, *args, **kwargs):
-        self.request = request
+        if not self.has_permission():
+            raise PermissionDenied
         self.object = self.get_object()
-        self.object.consume(request.user)
+        # The token is consumed using a conditional UPDATE query: if another request consumed
+        # it in the meantime, the action must not be executed twice.
+        if not self.model.objects.try_consume(self.object.key, request.user, token=self.object):
+            raise PermissionDenied
+        return HttpResponseRedirect(self.get_redirect_url())
+
+
+class AccountActionBulkConsumeView(AccountActionKeyMixin, View):
+    """
+    This views can be used to consume many account action tokens at once. The keys of the tokens
+    are submitted using the "keys" POST parameter ; the related actions are executed in batch.
+    """
+    http_method_names = ['post', ]
+    keys_post_field = 'keys'
+    # The maximum number of keys that can be submitted at once.
+    max_keys = 50
+    model = AccountActionToken
+    success_url = '/'
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise PermissionDenied
+        return super(AccountActionBulkConsumeView, self).dispatch(request, *args, **kwargs)
+
+    def get_keys(self):
+        return self.request.POST.getlist(self.keys_post_field)
+
+    def check_request(self, request, keys):
+        """ Rejects rate limited requests before querying the database.
+
+        Each key counts as a lookup for the rate limiter. An HTTP 429 response is returned if one
+        of the lookups is not allowed.
+        """
+        rate_limiter = get_rate_limiter()
+        # All the lookups are submitted to the rate limiter so that they are all accounted for.
+        allowed = [rate_limiter.is_allowed(request, key) for key in keys]
+        if not all(allowed):
+            incr('token.lookup.rate_limited')
+            return HttpResponse(status=429)
+
+    def get_redirect_url(self):
+        consumed_count = sum(
+            1 for result in self.results.values() if result == CONSUME_RESULT_CONSUMED)
+        if consumed_count:
+            messages.success(self.request, ngettext(
+                'The action was successfully performed!',
+                '%(count)d actions were successfully performed!',
+                consumed_count) % {'count': consumed_count})
+        if consumed_count < len(self.results):
+            messages.warning(self.request, ngettext(
+                'The action could not be performed.',
+                '%(count)d actions could not be performed.',
+                len(self.results) - consumed_count) % {
+                    'count': len(self.results) - consumed_count})
+        return self.success_url
+
+    def post(self, request, *args, **kwargs):
+        keys = self.get_keys()
+        if not keys or len(keys) > self.max_keys:
+            return HttpResponseBadRequest()
+
+        # Invalid keys (eg. forged or expired signed keys) cannot be associated with a token.
+        valid_keys = [key for key in keys if self.check_key(key)]
+        if len(valid_keys) < len(keys):
+            incr('token.lookup.rejected', len(keys) - len(valid_keys))
+        response = self.check_request(request, valid_keys)
+        if response is not None:
+            return response
+
+        results = self.model.objects.consume_many(valid_keys, request.user) if valid_keys else {}
+        self.results = OrderedDict(
+            (key, results.get(key, CONSUME_RESULT_NOT_FOUND)) for key in keys)
         return HttpResponseRedirect(self.get_redirect_url())
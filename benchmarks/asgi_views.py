@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the throughput of the sync and async landing views when they are served through the
+ASGI handler of Django.
+
+Usage: python -m benchmarks.asgi_views [--requests 1000] [--concurrency 50]
+
+The DJANGO_SETTINGS_MODULE environment variable can be used to run this script against another
+database than the temporary SQLite database used by default.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import django
+
+
+def _setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    from django.conf import settings
+    if settings.DATABASES['default']['NAME'] == ':memory:':
+        # The views are served from other threads, which cannot share an in-memory database.
+        settings.DATABASES['default']['NAME'] = os.path.join(
+            tempfile.mkdtemp(), 'benchmark.sqlite3')
+    django.setup()
+    from django.core.management import call_command
+    settings.ROOT_URLCONF = __name__
+    settings.ALLOWED_HOSTS = ['*']
+    call_command('migrate', verbosity=0, run_syncdb=True)
+
+
+def _get_urlpatterns():
+    from django.http import JsonResponse
+    from django.urls import path
+
+    from account_actions.views.asynchronous import AsyncAccountActionLandingView
+    from account_actions.views.generic import AccountActionLandingView
+
+    class RenderMixin(object):
+        # The benchmark does not depend on a template.
+        def render_to_response(self, context):
+            return JsonResponse({'key': context['token'].key})
+
+    class SyncView(RenderMixin, AccountActionLandingView):
+        pass
+
+    class AsyncView(RenderMixin, AsyncAccountActionLandingView):
+        pass
+
+    return [
+        path('sync/<str:key>/', SyncView.as_view()),
+        path('async/<str:key>/', AsyncView.as_view()),
+    ]
+
+
+def _seed(count):
+    from account_actions.action_base import AccountActionBase
+    from account_actions.action_pool import actions
+    from account_actions.models import AccountActionToken
+
+    class BenchmarkAction(AccountActionBase):
+        name = 'benchmark'
+
+        def execute(self, token):  # pragma: no cover
+            pass
+
+    actions.register(BenchmarkAction)
+    tokens = AccountActionToken.objects.bulk_issue(
+        [AccountActionToken(email='bench-{}@example.com'.format(i), action='benchmark')
+         for i in range(count)], notify=False)
+    return [token.key for token in tokens]
+
+
+async def _run(prefix, keys, requests, concurrency):
+    from django.test import AsyncClient
+
+    client = AsyncClient()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _request(i):
+        async with semaphore:
+            response = await client.get('/{}/{}/'.format(prefix, keys[i % len(keys)]))
+            assert response.status_code == 200, response.status_code
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_request(i) for i in range(requests)])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    _setup()
+    keys = _seed(100)
+
+    for prefix in ('sync', 'async'):
+        duration = asyncio.run(_run(prefix, keys, args.requests, args.concurrency))
+        print('{:>5} views: {:.0f} requests/s ({:.2f} ms/request)'.format(
+            prefix, args.requests / duration, duration * 1000 / args.requests))
+
+
+def __getattr__(name):
+    # The URL patterns are built lazily because they depend on the configured Django project.
+    if name == 'urlpatterns':
+        return _get_urlpatterns()
+    raise AttributeError(name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+Measures the performance of the lifecycle of action tokens (issuance, landing view, consumption,
+managers and admin changelist) against a table containing many tokens.
+
+Usage: python -m benchmarks.lifecycle [--tokens 10000] [--iterations 50] [--output FILE]
+
+The results are printed and written as JSON (to the given output file) so that they can be
+compared between versions. The database is selected by the benchmarks.settings module (SQLite by
+default, PostgreSQL when the BENCHMARK_DATABASE environment variable is set to 'postgresql'). The
+benchmark runs against a throwaway test database, which is destroyed once the results are computed.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import time
+
+import django
+
+
+def _setup():
+    """ Sets up the test environment and returns the name of the configured database. """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    # Allows the use of the test client and prevents emails from being sent.
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    # Each run uses its own database so that the results do not depend on the previous runs.
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    return old_name
+
+
+def _teardown(old_name):
+    from django.db import connection
+    from django.test.utils import teardown_test_environment
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+    teardown_test_environment()
+
+
+def _register_action():
+    from account_actions.action_base import AccountActionBase
+    from account_actions.action_pool import actions
+
+    class BenchmarkAction(AccountActionBase):
+        name = 'benchmark'
+
+        def execute(self, token):
+            pass
+
+    actions.register(BenchmarkAction)
+
+
+def _seed(count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from account_actions.test.factories import bulk_create_tokens
+
+    User.objects.bulk_create([User(username='bench-user-{}'.format(i)) for i in range(100)])
+    users = list(User.objects.filter(username__startswith='bench-user-'))
+
+    # Most of the historical tokens are consumed: only a few of them are still pending.
+    now = timezone.now()
+    bulk_create_tokens(
+        count, states={'pending': 7, 'consumed': 10, 'canceled': 1, 'expired': 2},
+        created=lambda i: now - dt.timedelta(days=i % 30), users=users, action='benchmark')
+    return users
+
+
+def _measure(func, iterations, setup=None):
+    """
+    Runs the given function many times and returns statistics about its duration (in
+    milliseconds) and the number of queries it performs.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    durations = []
+    queries = []
+    for i in range(iterations):
+        args = setup(i) if setup is not None else ()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func(*args)
+            durations.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context.captured_queries))
+    durations.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': statistics.mean(durations),
+        'median_ms': statistics.median(durations),
+        'p95_ms': durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+        'queries': max(queries),
+    }
+
+
+def _bench_issuance(iterations):
+    from account_actions.models import AccountActionToken
+    from account_actions.test.factories import AccountActionTokenFactory
+
+    single = _measure(
+        lambda: AccountActionTokenFactory.create(action='benchmark'), iterations)
+    batch_size = 1000
+    start = time.perf_counter()
+    AccountActionToken.objects.bulk_issue(
+        AccountActionTokenFactory.build_batch(batch_size, action='benchmark'), notify=False)
+    duration = time.perf_counter() - start
+    return {
+        'issuance': dict(single, tokens_per_second=1000 / single['mean_ms']),
+        'bulk_issuance': {
+            'tokens': batch_size, 'duration_ms': duration * 1000,
+            'tokens_per_second': batch_size / duration,
+        },
+    }
+
+
+def _bench_views(iterations):
+    from django.contrib.messages.middleware import MessageMiddleware
+    from django.contrib.sessions.middleware import SessionMiddleware
+    from django.http import JsonResponse
+    from django.test import RequestFactory
+
+    from account_actions.models import AccountActionToken
+    from account_actions.test.factories import AccountActionTokenFactory
+    from account_actions.views.generic import AccountActionConsumeView
+    from account_actions.views.generic import AccountActionLandingView
+
+    class LandingView(AccountActionLandingView):
+        # The benchmark does not depend on a template.
+        def render_to_response(self, context):
+            return JsonResponse({'key': context['token'].key})
+
+    factory = RequestFactory()
+    # Each consumption requires its own pending token.
+    keys = [token.key for token in AccountActionToken.objects.bulk_issue(
+        AccountActionTokenFactory.build_batch(iterations * 2, action='benchmark'), notify=False)]
+    user = AccountActionToken.consumed_objects.select_related('user').first().user
+    landing_view = LandingView.as_view()
+    consume_view = AccountActionConsumeView.as_view()
+
+    def _landing_request(i):
+        request = factory.get('/')
+        request.user = user
+        return request, keys[i % len(keys)]
+
+    def _consume_request(i):
+        request = factory.post('/')
+        SessionMiddleware(lambda request: None).process_request(request)
+        MessageMiddleware(lambda request: None).process_request(request)
+        request.user = user
+        return request, keys[iterations + i]
+
+    return {
+        'landing_view': _measure(
+            lambda request, key: landing_view(request, key=key), iterations,
+            setup=_landing_request),
+        'consume_view': _measure(
+            lambda request, key: consume_view(request, key=key), iterations,
+            setup=_consume_request),
+    }
+
+
+def _bench_managers(iterations):
+    from account_actions.models import AccountActionToken
+
+    return {
+        'pending_tokens_page': _measure(
+            lambda: list(AccountActionToken.pending_objects.order_by('-expires_at')[:100]),
+            iterations),
+        'pending_tokens_count': _measure(
+            lambda: AccountActionToken.pending_objects.count(), iterations),
+        'consumed_tokens_page': _measure(
+            lambda: list(AccountActionToken.consumed_objects.order_by('-pk')[:100]), iterations),
+        'consumed_tokens_count': _measure(
+            lambda: AccountActionToken.consumed_objects.count(), iterations),
+    }
+
+
+def _bench_admin(iterations):
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    admin_user = User.objects.create_superuser('bench-admin', 'admin@example.com', 'password')
+    client = Client()
+    client.force_login(admin_user)
+
+    def _get(url):
+        response = client.get(url)
+        assert response.status_code == 200, response.status_code
+
+    url = '/admin/account_actions/accountactiontoken/'
+    return {
+        'admin_changelist': _measure(lambda: _get(url), iterations),
+        'admin_changelist_filtered': _measure(
+            lambda: _get(url + '?is_consumed=No&is_expired=No'), iterations),
+    }
+
+
+def _run(args):
+    from django.db import connection
+    from django.utils import timezone
+
+    import account_actions
+
+    _register_action()
+    start = time.perf_counter()
+    _seed(args.tokens)
+    seeding_duration = time.perf_counter() - start
+
+    results = {}
+    results.update(_bench_managers(args.iterations))
+    results.update(_bench_views(args.iterations))
+    results.update(_bench_admin(args.iterations))
+    results.update(_bench_issuance(args.iterations))
+
+    return {
+        'meta': {
+            'tokens': args.tokens,
+            'seeding_duration_ms': seeding_duration * 1000,
+            'database': connection.vendor,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'account_actions': account_actions.__version__,
+            'date': timezone.now().isoformat(),
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--output', help='The path of the JSON file containing the results')
+    args = parser.parse_args()
+
+    old_name = _setup()
+    try:
+        report = _run(args)
+    finally:
+        _teardown(old_name)
+    results = report['results']
+    for name, result in results.items():
+        print('{:<28} {}'.format(name, ', '.join(
+            '{}={:.2f}'.format(key, value) if isinstance(value, float)
+            else '{}={}'.format(key, value) for key, value in result.items())))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
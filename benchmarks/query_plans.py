@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Shows the query plans (and timings) of the hot AccountActionToken queries with and without the
+indexes defined on the model.
+
+Usage: python -m benchmarks.query_plans [--tokens 100000]
+
+The DJANGO_SETTINGS_MODULE environment variable can be used to run this script against another
+database than the in-memory SQLite database used by the test suite.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+import copy
+import datetime as dt
+import os
+import random
+import timeit
+
+import django
+
+
+def _setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, run_syncdb=True)
+
+
+def _seed(count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from account_actions.core.key import gen_action_key
+    from account_actions.models import AccountActionToken
+
+    users = [
+        User.objects.create(username='bench-user-{}'.format(i)) for i in range(100)]
+    now = timezone.now()
+    tokens = []
+    for i in range(count):
+        # Most of the historical tokens are consumed: only a few of them are still pending.
+        consumed = i % 50 != 0
+        tokens.append(AccountActionToken(
+            key=gen_action_key(), email='bench-{}@example.com'.format(i),
+            action='action-{}'.format(i % 10), created=now - dt.timedelta(days=i % 365),
+            user=random.choice(users) if consumed else None,
+            consumption_date=now if consumed else None,
+            content_object=random.choice(users)))
+    AccountActionToken.objects.bulk_issue(tokens, batch_size=5000, notify=False)
+    return users
+
+
+def _queries(users):
+    from account_actions.models import AccountActionToken
+    return [
+        ('pending tokens', lambda: AccountActionToken.pending_objects.all()),
+        ('pending tokens for an object',
+            lambda: AccountActionToken.pending_objects.get_for_object(users[0])),
+        ('tokens of an action',
+            lambda: AccountActionToken.objects.filter(action='action-1').order_by('-created')),
+    ]
+
+
+def _report(title, users):
+    from django.db import connection
+    print('=' * 80)
+    print(title)
+    print('=' * 80)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    for name, get_queryset in _queries(users):
+        duration = timeit.timeit(
+            lambda: list(get_queryset().values_list('pk', flat=True)), number=5) / 5
+        print('--- {} ({:.2f} ms)'.format(name, duration * 1000))
+        print(get_queryset().explain())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=100000)
+    args = parser.parse_args()
+
+    _setup()
+
+    from django.db import connection
+    from account_actions.models import AccountActionToken
+
+    users = _seed(args.tokens)
+    _report('With indexes', users)
+
+    with connection.schema_editor() as schema_editor:
+        # The expiration date is also indexed by its field definition (db_index=True). This index
+        # is removed first because SQLite rebuilds the table (and its Meta.indexes) to alter it.
+        expires_at = AccountActionToken._meta.get_field('expires_at')
+        unindexed_expires_at = copy.copy(expires_at)
+        unindexed_expires_at.db_index = False
+        schema_editor.alter_field(AccountActionToken, expires_at, unindexed_expires_at)
+        for index in AccountActionToken._meta.indexes:
+            schema_editor.remove_index(AccountActionToken, index)
+    _report('Without indexes', users)
+
+
+if __name__ == '__main__':
+    main()
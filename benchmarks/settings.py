@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""
+Settings used by the benchmarks. The database is selected using the BENCHMARK_DATABASE
+environment variable: 'sqlite' (default, temporary database file) or 'postgresql' (configured
+by the BENCHMARK_POSTGRESQL_NAME, BENCHMARK_POSTGRESQL_USER, BENCHMARK_POSTGRESQL_PASSWORD,
+BENCHMARK_POSTGRESQL_HOST and BENCHMARK_POSTGRESQL_PORT environment variables).
+"""
+
+from __future__ import unicode_literals
+import os
+import tempfile
+
+from tests.settings import *  # noqa
+
+
+if os.environ.get('BENCHMARK_DATABASE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('BENCHMARK_POSTGRESQL_NAME', 'account_actions_benchmark'),
+            'USER': os.environ.get('BENCHMARK_POSTGRESQL_USER', ''),
+            'PASSWORD': os.environ.get('BENCHMARK_POSTGRESQL_PASSWORD', ''),
+            'HOST': os.environ.get('BENCHMARK_POSTGRESQL_HOST', ''),
+            'PORT': os.environ.get('BENCHMARK_POSTGRESQL_PORT', ''),
+        },
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3'),
+        },
+    }
@@ -1,15 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from django.conf.urls import include
-from django.conf.urls import url
 from django.contrib import admin
-from django.contrib.staticfiles.urls import staticfiles_urlpatterns
+from django.urls import path
 
 
-admin.autodiscover()
-
 urlpatterns = [
-    '',
-    url(r'^admin/', include(admin.site.urls)),
+    path('admin/', admin.site.urls),
 ]
-urlpatterns += staticfiles_urlpatterns()
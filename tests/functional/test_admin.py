@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import pytest
+
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.core.paginator import EstimatedCountPaginator
+from account_actions.models import AccountActionToken
+from account_actions.test.factories import AccountActionTokenFactory
+from account_actions.test.factories import ExpiredAccountActionTokenFactory
+
+
+class NotificationAction(AccountActionBase):
+    name = 'notification'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def get_notification_email(self, token):
+        return EmailMessage('Invitation', token.key, to=[token.email, ])
+
+
+@pytest.mark.django_db
+class TestAccountActionTokenAdmin(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self, client):
+        self.user = User.objects.create_superuser(
+            username='admin', password='not_secret', email='admin@example.com')
+        self.client = client
+        self.client.force_login(self.user)
+        self.url = reverse('admin:account_actions_accountactiontoken_changelist')
+        yield
+        actions.unregister_all()
+
+    def _get_changelist_queries_count(self, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, params)
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    def test_displays_the_changelist_using_a_constant_number_of_queries(self):
+        # Setup
+        AccountActionTokenFactory.create_batch(2)
+        queries_count = self._get_changelist_queries_count()
+        for token in AccountActionTokenFactory.create_batch(50):
+            token.consume(self.user)
+        ExpiredAccountActionTokenFactory.create_batch(50)
+        # Run & check
+        assert self._get_changelist_queries_count() == queries_count
+
+    def test_can_sort_the_changelist_using_the_computed_flags(self):
+        # Setup
+        token_1 = AccountActionTokenFactory.create()
+        token_2 = ExpiredAccountActionTokenFactory.create()
+        token_3 = AccountActionTokenFactory.create()
+        token_3.consume(self.user)
+        # Run
+        response_1 = self.client.get(self.url, {'o': '-9'})
+        response_2 = self.client.get(self.url, {'o': '-10.1'})
+        # Check
+        assert list(response_1.context['cl'].result_list)[0] == token_2
+        assert list(response_2.context['cl'].result_list)[0] == token_3
+        assert token_1 in response_1.context['cl'].result_list
+
+    def test_can_search_tokens_using_indexed_lookups(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'ADMIN_SEARCH_MODE', 'indexed')
+        token_1 = AccountActionTokenFactory.create(email='John.Doe@example.com')
+        token_2 = AccountActionTokenFactory.create(email='jane@example.com')
+        AccountActionTokenFactory.create(email='doe@example.com', first_name='John')
+        # Run
+        response_1 = self.client.get(self.url, {'q': 'john'})
+        response_2 = self.client.get(self.url, {'q': token_2.key})
+        # Check
+        assert list(response_1.context['cl'].result_list) == [token_1, ]
+        assert list(response_2.context['cl'].result_list) == [token_2, ]
+
+    def test_can_use_estimated_counts(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'ADMIN_ESTIMATED_COUNT', True)
+        AccountActionTokenFactory.create_batch(3)
+        # Run
+        response = self.client.get(self.url)
+        # Check
+        assert isinstance(response.context['cl'].paginator, EstimatedCountPaginator)
+        assert response.context['cl'].result_count == 3
+        assert not response.context['cl'].show_full_result_count
+
+    def _run_action(self, action, tokens):
+        return self.client.post(self.url, {
+            'action': action,
+            '_selected_action': [token.pk for token in tokens],
+        }, follow=True)
+
+    def test_can_cancel_and_uncancel_tokens_by_chunks(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'ADMIN_ACTION_CHUNK_SIZE', 2)
+        tokens = AccountActionTokenFactory.create_batch(5)
+        # Run & check
+        response = self._run_action('cancel', tokens[:3])
+        assert AccountActionToken.objects.filter(
+            is_canceled=True, status=AccountActionToken.STATUS_CANCELED).count() == 3
+        assert '3 action tokens were canceled.' in [str(m) for m in response.context['messages']]
+        response = self._run_action('uncancel', tokens)
+        assert AccountActionToken.pending_objects.count() == 5
+        assert '5 action tokens were uncanceled.' in [
+            str(m) for m in response.context['messages']]
+
+    def test_can_resend_the_notifications_of_pending_tokens(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'ADMIN_ACTION_CHUNK_SIZE', 2)
+        actions.register(NotificationAction)
+        tokens = AccountActionTokenFactory.create_batch(3, action='notification')
+        tokens.append(AccountActionTokenFactory.create(action='notification', is_canceled=True))
+        mail.outbox = []
+        # Run
+        response = self._run_action('resend_notification', tokens)
+        # Check
+        assert sorted(m.body for m in mail.outbox) == sorted(t.key for t in tokens[:3])
+        assert 'The notifications of 3 pending action tokens were sent.' in [
+            str(m) for m in response.context['messages']]
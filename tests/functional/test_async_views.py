@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import User
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.test import RequestFactory
+import pytest
+
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.test.factories import AccountActionTokenFactory
+from account_actions.views.asynchronous import AsyncAccountActionConsumeView
+from account_actions.views.asynchronous import AsyncAccountActionLandingView
+
+
+executed_tokens = []
+
+
+class Action1(AccountActionBase):
+    name = 'action-1'
+
+    def execute(self, token):
+        executed_tokens.append(token.key)
+
+    def get_extra_context(self, token, user):
+        return {'extra': token.email}
+
+
+class Action2(AccountActionBase):
+    name = 'action-2'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    async def acan_be_consumed(self, token, user):
+        return False
+
+
+class Action3(AccountActionBase):
+    name = 'action-3'
+
+    def execute(self, token):
+        executed_tokens.append(token.key)
+
+    def get_consumption_redirect_url(self, token):
+        # The redirect URL is computed using the ORM.
+        return '/users/{}/'.format(User.objects.get(pk=token.user_id).username)
+
+
+@pytest.mark.django_db
+class TestAsyncAccountActionLandingView(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        self.factory = RequestFactory()
+        yield
+        actions.unregister_all()
+
+    def test_return_an_http_404_error_if_the_token_cannot_be_found(self):
+        # Setup
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AsyncAccountActionLandingView.as_view()
+        # Run & check
+        with pytest.raises(Http404):
+            async_to_sync(view)(request, key='0' * 32)
+
+    def test_embeds_the_action_configuration_into_the_context(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1', email='test@example.com')
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AsyncAccountActionLandingView.as_view()
+        # Run
+        response = async_to_sync(view)(request, key=token.key)
+        # Check
+        assert response.status_code == 200
+        assert response.context_data['token'] == token
+        assert isinstance(response.context_data['action'], Action1)
+        assert response.context_data['extra'] == 'test@example.com'
+
+    def test_does_not_check_the_request_on_the_event_loop(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        running_loops = []
+
+        class RecordingLandingView(AsyncAccountActionLandingView):
+            def check_request(self, request, key):
+                try:
+                    running_loops.append(asyncio.get_running_loop())
+                except RuntimeError:
+                    running_loops.append(None)
+                return super(RecordingLandingView, self).check_request(request, key)
+
+        view = RecordingLandingView.as_view()
+        # Run
+        response = async_to_sync(view)(request, key=token.key)
+        # Check
+        assert response.status_code == 200
+        assert running_loops == [None, ]
+
+
+@pytest.mark.django_db
+class TestAsyncAccountActionConsumeView(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        self.factory = RequestFactory()
+        del executed_tokens[:]
+        yield
+        actions.unregister_all()
+
+    def _build_request(self, user):
+        request = self.factory.post('/')
+        SessionMiddleware().process_request(request)
+        MessageMiddleware().process_request(request)
+        request.user = user
+        return request
+
+    def test_return_an_http_403_error_if_the_user_is_not_authenticated(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        view = AsyncAccountActionConsumeView.as_view()
+        # Run & check
+        with pytest.raises(PermissionDenied):
+            async_to_sync(view)(self._build_request(AnonymousUser()), key=token.key)
+
+    def test_return_an_http_403_error_if_the_action_cannot_be_consumed(self):
+        # Setup
+        actions.register(Action2)
+        token = AccountActionTokenFactory.create(action='action-2')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        view = AsyncAccountActionConsumeView.as_view()
+        # Run & check
+        with pytest.raises(PermissionDenied):
+            async_to_sync(view)(self._build_request(user), key=token.key)
+
+    def test_can_consume_an_action_token(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        view = AsyncAccountActionConsumeView.as_view()
+        # Run
+        response = async_to_sync(view)(self._build_request(user), key=token.key)
+        # Check
+        assert response.status_code == 302
+        token.refresh_from_db()
+        assert token.is_consumed
+        assert token.user == user
+        assert executed_tokens == [token.key, ]
+
+    def test_can_compute_the_redirect_url_using_the_orm(self):
+        # Setup
+        actions.register(Action3)
+        token = AccountActionTokenFactory.create(action='action-3')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        view = AsyncAccountActionConsumeView.as_view()
+        # Run
+        response = async_to_sync(view)(self._build_request(user), key=token.key)
+        # Check
+        assert response.status_code == 302
+        assert response.url == '/users/test/'
+        assert executed_tokens == [token.key, ]
+
+    def test_return_an_http_403_error_if_the_token_is_already_consumed(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token.consume(user)
+        view = AsyncAccountActionConsumeView.as_view()
+        # Run & check
+        with pytest.raises(PermissionDenied):
+            async_to_sync(view)(self._build_request(user), key=token.key)
+        assert executed_tokens == [token.key, ]
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import time
+
+from django.core.cache import caches
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.models import User
@@ -11,8 +14,12 @@ import pytest
 
 from account_actions.action_base import AccountActionBase
 from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.core.key import gen_signed_action_key
+from account_actions.models import AccountActionToken
 from account_actions.test.factories import AccountActionTokenFactory
 from account_actions.views.generic import AccountActionLandingView
+from account_actions.views.generic import AccountActionBulkConsumeView
 from account_actions.views.generic import AccountActionConsumeView
 
 
@@ -94,6 +101,118 @@ class TestAccountActionLandingView(object):
         assert response.status_code == 200
         assert response.template_name == ['action-2.html', ]
 
+    def test_fetches_the_token_using_a_single_query(self, django_assert_num_queries):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self.factory.get('/')
+        request.user = user
+
+        view = AccountActionLandingView.as_view()
+
+        # Run & check
+        with django_assert_num_queries(1):
+            response = view(request, key=token.key)
+        assert response.status_code == 200
+
+    def test_can_use_the_token_cache(self, monkeypatch, django_assert_num_queries):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'TOKEN_CACHE', 'default')
+        caches['default'].clear()
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self.factory.get('/')
+        request.user = user
+
+        view = AccountActionLandingView.as_view()
+        view(request, key=token.key)
+
+        # Run & check
+        with django_assert_num_queries(0):
+            response = view(request, key=token.key)
+        assert response.status_code == 200
+        assert response.context_data['token'] == token
+        caches['default'].clear()
+
+    def test_rejects_forged_signed_keys_without_querying_the_database(
+            self, django_assert_num_queries):
+        # Setup
+        actions.register(Action1)
+        key = gen_signed_action_key()
+        AccountActionTokenFactory.create(action='action-1', key=key)
+        forged_key = key[:-1] + ('A' if key[-1] != 'A' else 'B')
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AccountActionLandingView.as_view()
+        # Run & check
+        with django_assert_num_queries(0):
+            with pytest.raises(Http404):
+                view(request, key=forged_key)
+
+    def test_rejects_expired_signed_keys_without_querying_the_database(
+            self, django_assert_num_queries):
+        # Setup
+        actions.register(Action1)
+        key = gen_signed_action_key(timestamp=time.time() - 20 * 24 * 3600)
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AccountActionLandingView.as_view()
+        # Run & check
+        with django_assert_num_queries(0):
+            with pytest.raises(Http404):
+                view(request, key=key)
+
+    def test_can_fetch_tokens_using_signed_keys(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'KEY_FORMAT', 'signed')
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1', key='')
+        assert len(token.key) == 40
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AccountActionLandingView()
+        view.setup(request, key=token.key)
+        # Run & check
+        assert view.get_object() == token
+
+    def test_rejects_malformed_keys_without_querying_the_database(
+            self, django_assert_num_queries):
+        # Setup
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AccountActionLandingView.as_view()
+        # Run & check
+        for key in ('dummy', "' OR 1=1 --", 'A' * 32, 'a' * 1000):
+            with django_assert_num_queries(0):
+                with pytest.raises(Http404):
+                    view(request, key=key)
+
+    def test_returns_an_http_429_response_when_requests_are_rate_limited(
+            self, monkeypatch, django_assert_num_queries):
+        # Setup
+        caches['default'].clear()
+        monkeypatch.setattr(account_actions_settings, 'RATE_LIMITER', 'cache')
+        monkeypatch.setattr(
+            account_actions_settings, 'RATE_LIMITER_OPTIONS', {'rate_per_ip': 1})
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        view = AccountActionLandingView.as_view()
+        view(request, key=token.key)
+        # Run
+        with django_assert_num_queries(0):
+            response = view(request, key=token.key)
+        # Check
+        assert response.status_code == 429
+        caches['default'].clear()
+
 
 @pytest.mark.django_db
 class TestAccountActionConsumeView(object):
@@ -176,3 +295,156 @@ class TestAccountActionConsumeView(object):
         assert response.status_code == 302
         token.refresh_from_db()
         assert token.is_consumed
+
+    def test_return_an_http_403_error_if_the_token_is_consumed_concurrently(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+
+        request = self.factory.post('/')
+        request.user = user
+
+        view = AccountActionConsumeView()
+        view.request = request
+        view.kwargs = {'key': token.key}
+        view.args = ()
+        assert view.has_permission()
+
+        # Another request consumes the token in the meantime
+        token.consume(user)
+
+        # Run & check
+        with pytest.raises(PermissionDenied):
+            view.post(request, key=token.key)
+
+    def test_consumes_an_action_token_using_a_minimal_number_of_queries(
+            self, django_assert_num_queries):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+
+        session_middleware = SessionMiddleware()
+        message_middleware = MessageMiddleware()
+        request = self.factory.post('/')
+        session_middleware.process_request(request)
+        message_middleware.process_request(request)
+        request.user = user
+
+        view = AccountActionConsumeView.as_view()
+
+        # Run & check
+        # One query to fetch the token and one query to consume it
+        with django_assert_num_queries(2):
+            response = view(request, key=token.key)
+        assert response.status_code == 302
+
+
+@pytest.mark.django_db
+class TestAccountActionBulkConsumeView(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        self.factory = RequestFactory()
+        yield
+        actions.unregister_all()
+
+    def _build_request(self, data, user):
+        request = self.factory.post('/', data)
+        SessionMiddleware().process_request(request)
+        MessageMiddleware().process_request(request)
+        request.user = user
+        return request
+
+    def test_return_an_http_403_error_if_the_user_is_not_authenticated(self):
+        # Setup
+        actions.register(Action1)
+        token = AccountActionTokenFactory.create(action='action-1')
+        request = self._build_request({'keys': [token.key, ]}, AnonymousUser())
+        view = AccountActionBulkConsumeView.as_view()
+        # Run & check
+        with pytest.raises(PermissionDenied):
+            view(request)
+
+    def test_can_consume_many_action_tokens(self):
+        # Setup
+        actions.register(Action1)
+        actions.register(Action2)
+        token_1 = AccountActionTokenFactory.create(action='action-1')
+        token_2 = AccountActionTokenFactory.create(action='action-2')
+        token_3 = AccountActionTokenFactory.create(action='action-1', is_canceled=True)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self._build_request({'keys': [token_1.key, token_2.key, token_3.key]}, user)
+        view = AccountActionBulkConsumeView.as_view()
+        # Run
+        response = view(request)
+        # Check
+        assert response.status_code == 302
+        assert set(AccountActionToken.consumed_objects.values_list('pk', flat=True)) == {
+            token_1.pk, token_2.pk}
+
+    def test_return_an_http_400_error_if_too_many_keys_are_submitted(self):
+        # Setup
+        actions.register(Action1)
+        tokens = AccountActionTokenFactory.create_batch(3, action='action-1')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self._build_request({'keys': [token.key for token in tokens]}, user)
+        view = AccountActionBulkConsumeView.as_view(max_keys=2)
+        # Run
+        response = view(request)
+        # Check
+        assert response.status_code == 400
+        assert not AccountActionToken.consumed_objects.exists()
+
+    def test_does_not_query_the_database_for_invalid_keys(self, django_assert_num_queries):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        key = gen_signed_action_key()
+        AccountActionTokenFactory.create(action='action-1', key=key)
+        forged_key = key[:-1] + ('A' if key[-1] != 'A' else 'B')
+        expired_key = gen_signed_action_key(timestamp=time.time() - 20 * 24 * 3600)
+        request = self._build_request(
+            {'keys': ['dummy', '<script>', forged_key, expired_key]}, user)
+        view = AccountActionBulkConsumeView.as_view()
+        # Run & check
+        with django_assert_num_queries(0):
+            response = view(request)
+        assert response.status_code == 302
+        assert not AccountActionToken.consumed_objects.exists()
+
+    def test_return_an_http_400_error_if_no_keys_are_submitted(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self._build_request({}, user)
+        view = AccountActionBulkConsumeView.as_view()
+        # Run
+        response = view(request)
+        # Check
+        assert response.status_code == 400
+
+    def test_returns_an_http_429_response_when_requests_are_rate_limited(self, monkeypatch):
+        # Setup
+        caches['default'].clear()
+        monkeypatch.setattr(account_actions_settings, 'RATE_LIMITER', 'cache')
+        monkeypatch.setattr(
+            account_actions_settings, 'RATE_LIMITER_OPTIONS', {'rate_per_ip': 1})
+        actions.register(Action1)
+        tokens = AccountActionTokenFactory.create_batch(2, action='action-1')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        request = self._build_request({'keys': [token.key for token in tokens]}, user)
+        view = AccountActionBulkConsumeView.as_view()
+        # Run
+        response = view(request)
+        # Check
+        assert response.status_code == 429
+        assert not AccountActionToken.consumed_objects.exists()
+        caches['default'].clear()
@@ -59,10 +59,14 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 )
 
+MIDDLEWARE = MIDDLEWARE_CLASSES
+
 ADMINS = ('admin@example.com',)
 
 MEDIA_ROOT = os.path.join(TEST_ROOT, '_testdata/media/')
 
+STATIC_URL = '/static/'
+
 SITE_ID = 1
 
 # Setting this explicitly prevents Django 1.7+ from showing a
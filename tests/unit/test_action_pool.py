@@ -4,8 +4,11 @@ from django.core.exceptions import ImproperlyConfigured
 import pytest
 
 from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import AccountActionPool
 from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
 from account_actions.exceptions import ActionAlreadyRegistered
+from account_actions.exceptions import ActionNotRegistered
 
 
 class SimpleAction(AccountActionBase):
@@ -15,6 +18,16 @@ class SimpleAction(AccountActionBase):
         pass
 
 
+class NotificationAction(AccountActionBase):
+    name = 'notificationaction'
+
+    def execute(self, method):  # pragma: no cover
+        pass
+
+    def get_notification_email(self, token):  # pragma: no cover
+        return None
+
+
 @pytest.mark.django_db
 class TestAccountActionPool(object):
     @pytest.yield_fixture(autouse=True)
@@ -61,5 +74,79 @@ class TestAccountActionPool(object):
         with pytest.raises(ImproperlyConfigured):
             class ErrnoneousAction2(AccountActionBase):
                 name = 'test'
+        with pytest.raises(ImproperlyConfigured):
+            class ErrnoneousAction3(AccountActionBase):
+                name = 'test'
+                execution_mode = 'unknown'
+
+                def execute(self, token):  # pragma: no cover
+                    pass
         actions_count_after = len(actions.get_actions())
         assert actions_count_before == actions_count_after
+
+    def test_can_return_an_action_or_raise_if_it_is_not_registered(self):
+        # Setup
+        actions.register(SimpleAction)
+        # Run & check
+        assert isinstance(actions.get_action_or_raise('simpleaction'), SimpleAction)
+        with pytest.raises(ActionNotRegistered):
+            actions.get_action_or_raise('unknown')
+
+    def test_records_the_hooks_overridden_by_each_action(self):
+        # Setup
+        actions.register(SimpleAction)
+        actions.register(NotificationAction)
+        # Run
+        simple_entry = actions.get_entry('simpleaction')
+        notification_entry = actions.get_entry('notificationaction')
+        # Check
+        assert simple_entry.overridden_hooks == frozenset()
+        assert not simple_entry.sends_notification_emails
+        assert notification_entry.overridden_hooks == {'get_notification_email'}
+        assert notification_entry.sends_notification_emails
+        assert actions.get_entry('unknown') is None
+
+    def test_rebuilds_the_dispatch_table_when_actions_are_registered_after_the_freeze(self):
+        # Setup
+        table = actions.freeze()
+        # Run
+        actions.register(SimpleAction)
+        # Check
+        assert 'simpleaction' not in table
+        assert actions.get_entry('simpleaction').action is actions.get_action('simpleaction')
+        with pytest.raises(TypeError):
+            actions.freeze()['other'] = None
+
+
+class TestAccountActionPoolDiscovery(object):
+    def test_can_import_the_modules_listed_in_the_settings(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'MODULES', ['tests.unit.test_action_pool'])
+        pool = AccountActionPool()
+        # Run
+        pool.discover()
+        # Check
+        assert pool.discovered
+        assert pool.discovered_modules == ('tests.unit.test_action_pool', )
+        assert pool.discovery_duration >= 0
+
+    def test_can_scan_the_installed_applications(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'MODULES', None)
+        pool = AccountActionPool()
+        # Run
+        pool.discover()
+        # Check
+        assert pool.discovered
+        # None of the installed applications of the test project defines actions
+        assert pool.discovered_modules == ()
+
+    def test_discovers_the_actions_when_an_action_is_first_looked_up(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'MODULES', [])
+        pool = AccountActionPool()
+        # Run
+        action = pool.get_action('simpleaction')
+        # Check
+        assert action is None
+        assert pool.discovered
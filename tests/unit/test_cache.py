@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+import pytest
+
+from account_actions.cache import get_cached_token
+from account_actions.conf import settings as account_actions_settings
+from account_actions.models import AccountActionToken
+from account_actions.test.factories import AccountActionTokenFactory
+
+
+@pytest.mark.django_db
+class TestGetCachedToken(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(account_actions_settings, 'TOKEN_CACHE', 'default')
+        caches['default'].clear()
+        self.queryset = AccountActionToken.objects.all()
+        yield
+        caches['default'].clear()
+
+    def test_can_return_a_token_from_the_cache(self, django_assert_num_queries):
+        # Setup
+        token = AccountActionTokenFactory.create()
+        get_cached_token(token.key, self.queryset)
+        # Run & check
+        with django_assert_num_queries(0):
+            assert get_cached_token(token.key, self.queryset) == token
+
+    def test_caches_the_keys_that_are_not_associated_with_tokens(
+            self, django_assert_num_queries):
+        # Setup
+        with pytest.raises(AccountActionToken.DoesNotExist):
+            get_cached_token('dummy', self.queryset)
+        # Run & check
+        with django_assert_num_queries(0):
+            with pytest.raises(AccountActionToken.DoesNotExist):
+                get_cached_token('dummy', self.queryset)
+
+    def test_does_not_use_the_cache_if_it_is_not_configured(
+            self, monkeypatch, django_assert_num_queries):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'TOKEN_CACHE', None)
+        token = AccountActionTokenFactory.create()
+        get_cached_token(token.key, self.queryset)
+        # Run & check
+        with django_assert_num_queries(1):
+            get_cached_token(token.key, self.queryset)
+
+    def test_is_invalidated_when_tokens_are_saved(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create()
+        get_cached_token(token.key, self.queryset)
+        # Run
+        AccountActionToken.objects.get(pk=token.pk).consume(user)
+        # Check
+        assert get_cached_token(token.key, self.queryset).is_consumed
+
+    def test_is_invalidated_when_tokens_are_consumed_using_their_keys(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create()
+        get_cached_token(token.key, self.queryset)
+        # Run
+        AccountActionToken.objects.try_consume(token.key, user)
+        # Check
+        assert get_cached_token(token.key, self.queryset).is_consumed
+
+    def test_is_invalidated_when_tokens_are_consumed_asynchronously(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create()
+        get_cached_token(token.key, self.queryset)
+        # Run
+        async_to_sync(AccountActionToken.objects.atry_consume)(token.key, user)
+        # Check
+        assert get_cached_token(token.key, self.queryset).is_consumed
+
+    def test_is_invalidated_when_tokens_are_issued_in_bulk(self):
+        # Setup
+        with pytest.raises(AccountActionToken.DoesNotExist):
+            get_cached_token('new-key', self.queryset)
+        # Run
+        AccountActionToken.objects.bulk_issue(
+            [AccountActionToken(key='new-key', email='test@example.com', action='action')])
+        # Check
+        assert get_cached_token('new-key', self.queryset).key == 'new-key'
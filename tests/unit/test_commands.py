@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import datetime as dt
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+import pytest
+
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.models import AccountActionExecution
+from account_actions.models import AccountActionToken
+from account_actions.test.factories import AccountActionTokenFactory
+
+
+class BackgroundAction(AccountActionBase):
+    name = 'background-action'
+    execution_mode = 'background'
+
+    def execute(self, token):
+        pass
+
+
+@pytest.mark.django_db
+class TestPurgeAccountActionTokensCommand(object):
+    def test_can_purge_the_old_tokens(self):
+        # Setup
+        AccountActionTokenFactory.create(created=timezone.now() - dt.timedelta(days=200))
+        pending_token = AccountActionTokenFactory.create()
+        out = StringIO()
+        # Run
+        call_command('purge_account_action_tokens', stdout=out)
+        # Check
+        assert list(AccountActionToken.objects.all()) == [pending_token, ]
+        assert '1 action tokens deleted.' in out.getvalue()
+
+    def test_does_not_delete_anything_in_dry_run_mode(self):
+        # Setup
+        AccountActionTokenFactory.create(created=timezone.now() - dt.timedelta(days=200))
+        out = StringIO()
+        # Run
+        call_command('purge_account_action_tokens', '--dry-run', stdout=out)
+        # Check
+        assert AccountActionToken.objects.count() == 1
+        assert '1 action tokens would be deleted.' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestProcessAccountActionExecutionsCommand(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        actions.register(BackgroundAction)
+        yield
+        actions.unregister_all()
+
+    def test_can_run_the_due_executions(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(user)
+        out = StringIO()
+        # Run
+        call_command('process_account_action_executions', '--once', stdout=out)
+        # Check
+        assert AccountActionExecution.objects.get().status == AccountActionExecution.STATUS_DONE
+        assert '1 executions run.' in out.getvalue()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import threading
+
+from django.core import mail
+from django.core.mail import EmailMessage
+import pytest
+
+from account_actions import dispatchers
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.dispatchers import OnCommitDispatcher
+from account_actions.dispatchers import ThreadPoolDispatcher
+from account_actions.instrumentation import get_metrics_backend
+from account_actions.test.factories import AccountActionTokenFactory
+
+
+class EmailNotificationAction(AccountActionBase):
+    name = 'email-notification'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def get_notification_email(self, token):
+        return EmailMessage('Invitation', token.key, to=[token.email, ])
+
+
+@pytest.mark.django_db
+class TestNotificationDispatchers(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        actions.register(EmailNotificationAction)
+        yield
+        actions.unregister_all()
+
+    def test_sends_notification_emails_inline_by_default(self):
+        # Run
+        token = AccountActionTokenFactory.create(action='email-notification')
+        # Check
+        assert [m.body for m in mail.outbox] == [token.key, ]
+
+    def test_can_send_notification_emails_once_the_transaction_is_committed(
+            self, monkeypatch, django_capture_on_commit_callbacks):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'NOTIFICATION_DISPATCHER', 'on_commit')
+        # Run & check
+        with django_capture_on_commit_callbacks(execute=True):
+            token = AccountActionTokenFactory.create(action='email-notification')
+            assert not mail.outbox
+        assert isinstance(dispatchers.get_notification_dispatcher(), OnCommitDispatcher)
+        assert [m.body for m in mail.outbox] == [token.key, ]
+
+    def test_can_send_notification_emails_using_a_pool_of_threads(
+            self, monkeypatch, django_capture_on_commit_callbacks):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'NOTIFICATION_DISPATCHER', 'thread_pool')
+        monkeypatch.setattr(
+            account_actions_settings, 'NOTIFICATION_DISPATCHER_OPTIONS', {'max_workers': 2})
+        # Run
+        with django_capture_on_commit_callbacks(execute=True):
+            token = AccountActionTokenFactory.create(action='email-notification')
+        dispatcher = dispatchers.get_notification_dispatcher()
+        dispatcher.shutdown(wait=True)
+        # Check
+        assert isinstance(dispatcher, ThreadPoolDispatcher)
+        assert [m.body for m in mail.outbox] == [token.key, ]
+
+
+@pytest.mark.django_db
+class TestThreadPoolDispatcher(object):
+    def test_retries_failing_functions(self, django_capture_on_commit_callbacks):
+        # Setup
+        calls = []
+
+        def func():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ValueError
+
+        dispatcher = ThreadPoolDispatcher(max_retries=2, retry_delay=0)
+        # Run
+        with django_capture_on_commit_callbacks(execute=True):
+            dispatcher.dispatch(func)
+        dispatcher.shutdown(wait=True)
+        # Check
+        assert len(calls) == 3
+
+    def test_drops_functions_when_its_queue_is_full(
+            self, monkeypatch, django_capture_on_commit_callbacks):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'METRICS_BACKEND', 'memory')
+        backend = get_metrics_backend()
+        backend.reset()
+        event = threading.Event()
+        threads = []
+
+        def func():
+            threads.append(threading.current_thread())
+            # The first function keeps its slot until the second one is dispatched.
+            event.wait(5)
+
+        dispatcher = ThreadPoolDispatcher(max_workers=1, max_queue_size=1)
+        # Run
+        with django_capture_on_commit_callbacks(execute=True):
+            dispatcher.dispatch(func)
+            dispatcher.dispatch(func)
+        event.set()
+        dispatcher.shutdown(wait=True)
+        # Check
+        assert len(threads) == 1
+        assert threading.current_thread() not in threads
+        assert backend.get_count('dispatcher.dropped') == 1
+
+    def test_waits_for_a_slot_during_the_queue_timeout(self, django_capture_on_commit_callbacks):
+        # Setup
+        event = threading.Event()
+        threads = []
+
+        def func():
+            threads.append(threading.current_thread())
+
+        def blocking_func():
+            # The first function keeps its slot until the second one waits for a slot.
+            event.wait(5)
+
+        dispatcher = ThreadPoolDispatcher(max_workers=1, max_queue_size=1, queue_timeout=5)
+        # Run
+        with django_capture_on_commit_callbacks(execute=True):
+            dispatcher.dispatch(blocking_func)
+            threading.Timer(0.1, event.set).start()
+            dispatcher.dispatch(func)
+        dispatcher.shutdown(wait=True)
+        # Check
+        assert len(threads) == 1
+        assert threading.current_thread() not in threads
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import datetime as dt
+
+from django.core import mail
+from django.db.models.signals import post_save
+from django.utils import timezone
+import pytest
+
+from account_actions.models import AccountActionToken
+from account_actions.test.factories import bulk_create_tokens
+
+
+@pytest.mark.django_db
+class TestBulkCreateTokens(object):
+    def test_can_create_many_tokens_with_a_mix_of_states(self, django_assert_max_num_queries):
+        # Setup
+        states = {'pending': 5, 'consumed': 3, 'canceled': 1, 'expired': 1}
+        # Run
+        # The tokens are inserted by batches of 100 tokens (SQLite splits each batch according to
+        # its maximum number of query parameters) and each batch is then fetched again (SQLite
+        # does not return the primary keys of bulk inserted rows).
+        with django_assert_max_num_queries(40):
+            created = bulk_create_tokens(1000, states=states, batch_size=100)
+        # Check
+        assert created == 1000
+        assert AccountActionToken.objects.count() == 1000
+        assert AccountActionToken.pending_objects.count() == 500
+        assert AccountActionToken.consumed_objects.count() == 300
+        assert AccountActionToken.objects.filter(status='canceled').count() == 100
+        assert AccountActionToken.objects.filter(status='expired').count() == 100
+        assert not AccountActionToken.objects.filter(
+            status='pending', expires_at__lt=timezone.now()).exists()
+        # The states are interleaved
+        first_tokens = AccountActionToken.objects.order_by('pk')[:100]
+        assert len({token.status for token in first_tokens}) == 4
+
+    def test_can_use_arbitrary_creation_dates(self):
+        # Setup
+        now = timezone.now()
+        # Run
+        bulk_create_tokens(10, created=lambda i: now - dt.timedelta(days=i), action='action-1')
+        # Check
+        tokens = AccountActionToken.objects.order_by('pk')
+        assert [token.created for token in tokens] == [
+            now - dt.timedelta(days=i) for i in range(10)]
+        assert {token.action for token in tokens} == {'action-1'}
+
+    def test_does_not_send_signals(self):
+        # Setup
+        received = []
+
+        def receiver(sender, **kwargs):  # pragma: no cover
+            received.append(kwargs['instance'])
+        post_save.connect(receiver, sender=AccountActionToken)
+        # Run
+        try:
+            bulk_create_tokens(10)
+        finally:
+            post_save.disconnect(receiver, sender=AccountActionToken)
+        # Check
+        assert not received
+        assert not mail.outbox
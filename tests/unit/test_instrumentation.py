@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import socket
+
+from django.contrib.auth.models import User
+from django.http import Http404
+from django.test import RequestFactory
+import pytest
+
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.instrumentation import InMemoryMetricsBackend
+from account_actions.instrumentation import StatsdMetricsBackend
+from account_actions.instrumentation import get_metrics_backend
+from account_actions.instrumentation import incr
+from account_actions.instrumentation import timed
+from account_actions.test.factories import AccountActionTokenFactory
+from account_actions.views.generic import AccountActionLandingView
+
+
+class InstrumentedAction(AccountActionBase):
+    name = 'instrumented'
+
+    def execute(self, token):
+        pass
+
+
+class TestInMemoryMetricsBackend(object):
+    def test_can_record_timings_and_counters(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'METRICS_BACKEND', 'memory')
+        # Run
+        with timed('test.timing', action='action-1'):
+            pass
+        incr('test.counter')
+        incr('test.counter', 2)
+        # Check
+        backend = get_metrics_backend()
+        assert isinstance(backend, InMemoryMetricsBackend)
+        assert len(backend.get_timings('test.timing', action='action-1')) == 1
+        assert backend.get_timings('test.timing') == []
+        assert backend.get_count('test.counter') == 3
+
+
+class TestStatsdMetricsBackend(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(5)
+        yield
+        self.server.close()
+
+    def test_can_send_timings_and_counters(self):
+        # Setup
+        backend = StatsdMetricsBackend(port=self.server.getsockname()[1])
+        # Run
+        backend.timing('action.execute', 0.5, {'action': 'action-1'})
+        backend.incr('token.lookup.miss')
+        # Check
+        assert self.server.recv(1024) == b'account_actions.action.execute.action-1:500.000|ms'
+        assert self.server.recv(1024) == b'account_actions.token.lookup.miss:1|c'
+
+    def test_can_send_tags_using_the_dogstatsd_format(self):
+        # Setup
+        backend = StatsdMetricsBackend(port=self.server.getsockname()[1], use_tags=True)
+        # Run
+        backend.incr('token.consume', tags={'action': 'action-1'})
+        # Check
+        assert self.server.recv(1024) == b'account_actions.token.consume:1|c|#action:action-1'
+
+
+@pytest.mark.django_db
+class TestInstrumentationHooks(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self, monkeypatch):
+        monkeypatch.setattr(account_actions_settings, 'METRICS_BACKEND', 'memory')
+        self.backend = get_metrics_backend()
+        self.backend.reset()
+        yield
+        actions.unregister_all()
+
+    def test_times_the_issuance_and_the_consumption_of_tokens(self):
+        # Setup
+        actions.register(InstrumentedAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run
+        token = AccountActionTokenFactory.create(action='instrumented')
+        token.consume(user)
+        # Check
+        assert len(self.backend.get_timings('token.issue', action='instrumented')) == 1
+        assert len(self.backend.get_timings('token.consume', action='instrumented')) == 1
+        assert len(self.backend.get_timings('action.execute', action='instrumented')) == 1
+
+    def test_counts_the_lookup_misses(self):
+        # Setup
+        request = RequestFactory().get('/')
+        view = AccountActionLandingView.as_view()
+        # Run
+        with pytest.raises(Http404):
+            view(request, key='0' * 32)
+        with pytest.raises(Http404):
+            view(request, key='dummy')
+        # Check
+        assert len(self.backend.get_timings('token.lookup')) == 1
+        assert self.backend.get_count('token.lookup.miss') == 1
+        assert self.backend.get_count('token.lookup.rejected') == 1
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import datetime as dt
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+import pytest
+
+from account_actions.conf import settings as account_actions_settings
+from account_actions.core.key import check_signed_action_key
+from account_actions.core.key import gen_action_key
+from account_actions.core.key import gen_signed_action_key
+
+
+class TestGenActionKey(object):
+    def test_generates_uuid_keys_by_default(self):
+        # Run
+        key = gen_action_key()
+        # Check
+        assert len(key) == 32
+        assert not check_signed_action_key(key)
+
+    def test_can_generate_signed_keys(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'KEY_FORMAT', 'signed')
+        # Run
+        key = gen_action_key()
+        # Check
+        assert len(key) <= 40
+        assert check_signed_action_key(key)
+
+    def test_cannot_use_an_unknown_key_format(self):
+        # Run & check
+        with pytest.raises(ImproperlyConfigured):
+            gen_action_key('dummy')
+
+
+class TestCheckSignedActionKey(object):
+    def test_rejects_forged_keys(self):
+        # Setup
+        key = gen_signed_action_key()
+        forged_key = key[:-1] + ('A' if key[-1] != 'A' else 'B')
+        # Run & check
+        assert not check_signed_action_key(forged_key)
+
+    def test_rejects_keys_signed_using_another_secret_key(self, settings):
+        # Setup
+        key = gen_signed_action_key()
+        settings.SECRET_KEY = 'another-secret-key'
+        # Run & check
+        assert not check_signed_action_key(key)
+
+    def test_rejects_keys_that_are_older_than_the_max_age(self):
+        # Setup
+        key = gen_signed_action_key(timestamp=time.time() - 11 * 24 * 3600)
+        # Run & check
+        assert check_signed_action_key(key)
+        assert check_signed_action_key(key, max_age=dt.timedelta(days=12))
+        assert not check_signed_action_key(key, max_age=dt.timedelta(days=10))
@@ -3,14 +3,418 @@
 import datetime as dt
 
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.core.mail import EmailMessage
 from django.utils import timezone
 import pytest
 
+from account_actions.action_base import AccountActionBase
+from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.managers import CONSUME_RESULT_ALREADY_CONSUMED
+from account_actions.managers import CONSUME_RESULT_CANCELED
+from account_actions.managers import CONSUME_RESULT_CONSUMED
+from account_actions.managers import CONSUME_RESULT_EXPIRED
+from account_actions.managers import CONSUME_RESULT_NOT_FOUND
 from account_actions.models import AccountActionToken
 from account_actions.test.factories import AccountActionTokenFactory, \
     ExpiredAccountActionTokenFactory
 
 
+class BulkNotificationAction(AccountActionBase):
+    name = 'bulk-notification'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def get_notification_email(self, token):
+        return EmailMessage('Invitation', token.key, to=[token.email, ])
+
+
+sent_notifications = []
+executed_tokens = []
+executed_batches = []
+
+
+class LegacyNotificationAction(AccountActionBase):
+    name = 'legacy-notification'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def send_notification_email(self, token):
+        sent_notifications.append(token.key)
+
+
+class ExecutionAction(AccountActionBase):
+    name = 'execution'
+
+    def execute(self, token):
+        executed_tokens.append(token.key)
+
+
+class BatchExecutionAction(AccountActionBase):
+    name = 'batch-execution'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def execute_many(self, tokens):
+        executed_batches.append([token.key for token in tokens])
+
+
+class ShortLivedAction(AccountActionBase):
+    name = 'short-lived'
+    validity_duration = 2
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+
+class CustomExpirationAction(AccountActionBase):
+    name = 'custom-expiration'
+
+    def execute(self, token):  # pragma: no cover
+        pass
+
+    def get_expiration_date(self, token):
+        return token.created + dt.timedelta(hours=1)
+
+
+@pytest.mark.django_db
+class TestAccountActionTokenManager(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        del sent_notifications[:]
+        del executed_tokens[:]
+        del executed_batches[:]
+        yield
+        actions.unregister_all()
+
+    def test_can_issue_many_tokens_at_once(self):
+        # Setup
+        tokens = [
+            AccountActionToken(email='test{}@example.com'.format(i), action='action-1')
+            for i in range(5)]
+        # Run
+        created_tokens = AccountActionToken.objects.bulk_issue(tokens, batch_size=2)
+        # Check
+        assert len(created_tokens) == 5
+        assert AccountActionToken.pending_objects.count() == 5
+        keys = set(AccountActionToken.objects.values_list('key', flat=True))
+        assert len(keys) == 5
+        assert all(keys)
+
+    def test_returns_saved_tokens_when_issuing_many_tokens_at_once(self):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        tokens = [
+            AccountActionToken(email='test{}@example.com'.format(i), action='execution')
+            for i in range(3)]
+        # Run
+        created_tokens = AccountActionToken.objects.bulk_issue(tokens, batch_size=2)
+        created_tokens[0].consume(user)
+        # Check
+        assert [token.email for token in created_tokens] == [token.email for token in tokens]
+        assert all(token.pk is not None for token in created_tokens)
+        assert not any(token._state.adding for token in created_tokens)
+        assert AccountActionToken.objects.count() == 3
+        assert AccountActionToken.consumed_objects.get() == created_tokens[0]
+        assert executed_tokens == [created_tokens[0].key, ]
+
+    def test_sends_the_notification_emails_in_batches(self):
+        # Setup
+        actions.register(BulkNotificationAction)
+        tokens = [
+            AccountActionToken(email='test{}@example.com'.format(i), action='bulk-notification')
+            for i in range(5)]
+        # Run
+        created_tokens = AccountActionToken.objects.bulk_issue(tokens, batch_size=2)
+        # Check
+        assert len(mail.outbox) == 5
+        assert sorted(m.body for m in mail.outbox) == sorted(t.key for t in created_tokens)
+
+    def test_can_issue_tokens_without_sending_notification_emails(self):
+        # Setup
+        actions.register(BulkNotificationAction)
+        tokens = [AccountActionToken(email='test@example.com', action='bulk-notification')]
+        # Run
+        AccountActionToken.objects.bulk_issue(tokens, notify=False)
+        # Check
+        assert AccountActionToken.objects.count() == 1
+        assert not mail.outbox
+
+    def test_supports_actions_that_override_send_notification_email(self):
+        # Setup
+        actions.register(LegacyNotificationAction)
+        tokens = [
+            AccountActionToken(email='test{}@example.com'.format(i), action='legacy-notification')
+            for i in range(3)]
+        # Run
+        created_tokens = AccountActionToken.objects.bulk_issue(tokens)
+        # Check
+        assert sent_notifications == [t.key for t in created_tokens]
+
+    def test_can_consume_a_token_by_using_its_key(self):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create(action='execution')
+        # Run
+        consumed = AccountActionToken.objects.try_consume(token.key, user)
+        # Check
+        assert consumed
+        token.refresh_from_db()
+        assert token.is_consumed
+        assert token.user == user
+        assert token.status == AccountActionToken.STATUS_CONSUMED
+        assert executed_tokens == [token.key, ]
+
+    def test_can_consume_a_token_only_once(self):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create(action='execution')
+        # Run
+        consumed_1 = AccountActionToken.objects.try_consume(token.key, user, token=token)
+        consumed_2 = AccountActionToken.objects.try_consume(token.key, user, token=token)
+        # Check
+        assert consumed_1
+        assert not consumed_2
+        assert token.is_consumed
+        assert executed_tokens == [token.key, ]
+
+    def test_cannot_consume_canceled_or_expired_tokens(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create(is_canceled=True)
+        token_2 = ExpiredAccountActionTokenFactory.create()
+        # Run & check
+        assert not AccountActionToken.objects.try_consume(token_1.key, user)
+        assert not AccountActionToken.objects.try_consume(token_2.key, user)
+        assert not AccountActionToken.objects.try_consume('dummy', user)
+        assert not AccountActionToken.consumed_objects.exists()
+
+    def test_can_consume_many_tokens_at_once(self, django_assert_num_queries):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        tokens = AccountActionTokenFactory.create_batch(3, action='execution')
+        keys = [token.key for token in tokens]
+        # Run
+        # One query to fetch the tokens, one query to consume them and one query to identify the
+        # consumed tokens.
+        with django_assert_num_queries(3):
+            results = AccountActionToken.objects.consume_many(keys, user)
+        # Check
+        assert list(results.items()) == [(key, CONSUME_RESULT_CONSUMED) for key in keys]
+        assert AccountActionToken.consumed_objects.filter(user=user).count() == 3
+        assert executed_tokens == keys
+
+    def test_reports_the_tokens_that_cannot_be_consumed(self):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create(action='execution')
+        token_2 = AccountActionTokenFactory.create(action='execution', is_canceled=True)
+        token_3 = ExpiredAccountActionTokenFactory.create(action='execution')
+        token_4 = AccountActionTokenFactory.create(action='execution')
+        token_4.consume(user)
+        del executed_tokens[:]
+        # Run
+        results = AccountActionToken.objects.consume_many(
+            [token_1.key, token_2.key, token_3.key, token_4.key, 'dummy'], user)
+        # Check
+        assert results == {
+            token_1.key: CONSUME_RESULT_CONSUMED,
+            token_2.key: CONSUME_RESULT_CANCELED,
+            token_3.key: CONSUME_RESULT_EXPIRED,
+            token_4.key: CONSUME_RESULT_ALREADY_CONSUMED,
+            'dummy': CONSUME_RESULT_NOT_FOUND,
+        }
+        assert executed_tokens == [token_1.key, ]
+
+    def test_reports_the_tokens_consumed_concurrently_as_already_consumed(self, monkeypatch):
+        # Setup
+        actions.register(ExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create(action='execution')
+        token_2 = AccountActionTokenFactory.create(action='execution')
+
+        def can_be_consumed(self, token, user):
+            # Another request consumes the second token in the meantime
+            if token.key == token_2.key:
+                AccountActionToken.objects.try_consume(token.key, user)
+            return True
+        monkeypatch.setattr(ExecutionAction, 'can_be_consumed', can_be_consumed)
+        # Run
+        results = AccountActionToken.objects.consume_many([token_1.key, token_2.key], user)
+        # Check
+        assert results[token_1.key] == CONSUME_RESULT_CONSUMED
+        assert results[token_2.key] == CONSUME_RESULT_ALREADY_CONSUMED
+        assert executed_tokens == [token_2.key, token_1.key]
+
+    def test_executes_the_consumed_tokens_in_batch(self):
+        # Setup
+        actions.register(BatchExecutionAction)
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        tokens = AccountActionTokenFactory.create_batch(2, action='batch-execution')
+        # Run
+        AccountActionToken.objects.consume_many([token.key for token in tokens], user)
+        # Check
+        assert executed_batches == [[token.key for token in tokens], ]
+
+    def test_can_refresh_the_expiration_dates_of_the_tokens(self):
+        # Setup
+        actions.register(ShortLivedAction)
+        actions.register(CustomExpirationAction)
+        now = timezone.now()
+        token_1 = AccountActionTokenFactory.create(
+            action='short-lived', created=now - dt.timedelta(days=3))
+        token_2 = AccountActionTokenFactory.create(action='short-lived')
+        token_3 = AccountActionTokenFactory.create(action='custom-expiration')
+        token_4 = AccountActionTokenFactory.create(action='unknown')
+        # The validity durations changed after the creation of the tokens
+        AccountActionToken.objects.update(expires_at=now + dt.timedelta(days=100))
+        # Run
+        updated = AccountActionToken.objects.refresh_expiration_dates()
+        # Check
+        assert updated == 3
+        for token in (token_1, token_2, token_3, token_4):
+            token.refresh_from_db()
+        assert token_1.expires_at == token_1.created + dt.timedelta(days=2)
+        assert token_1.status == AccountActionToken.STATUS_EXPIRED
+        assert token_2.expires_at == token_2.created + dt.timedelta(days=2)
+        assert token_2.status == AccountActionToken.STATUS_PENDING
+        assert token_3.expires_at == now + dt.timedelta(days=100)
+        assert token_4.expires_at == token_4.created + dt.timedelta(
+            days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION)
+
+    def test_refreshes_the_expiration_dates_of_the_tokens_by_chunks(self):
+        # Setup
+        actions.register(ShortLivedAction)
+        tokens = AccountActionTokenFactory.create_batch(3, action='short-lived')
+        AccountActionToken.objects.update(expires_at=timezone.now() + dt.timedelta(days=100))
+        # Run
+        updated = AccountActionToken.objects.refresh_expiration_dates(chunk_size=2)
+        # Check
+        assert updated == 3
+        for token in tokens:
+            token.refresh_from_db()
+            assert token.expires_at == token.created + dt.timedelta(days=2)
+            assert token.status == AccountActionToken.STATUS_PENDING
+
+    def test_does_not_list_the_tokens_updated_without_their_status_as_pending(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create()
+        token_2 = AccountActionTokenFactory.create()
+        token_3 = AccountActionTokenFactory.create()
+        # Run
+        AccountActionToken.objects.filter(pk=token_1.pk).update(is_canceled=True)
+        AccountActionToken.objects.filter(pk=token_2.pk).update(
+            user=user, consumption_date=timezone.now())
+        # Check
+        assert list(AccountActionToken.pending_objects.all()) == [token_3, ]
+        assert list(AccountActionToken.consumed_objects.all()) == [token_2, ]
+
+    def test_can_list_the_pending_tokens_of_actions_with_different_lifetimes(
+            self, django_assert_num_queries):
+        # Setup
+        actions.register(ShortLivedAction)
+        now = timezone.now()
+        AccountActionTokenFactory.create(action='short-lived', created=now - dt.timedelta(days=3))
+        token_2 = AccountActionTokenFactory.create(action='short-lived')
+        token_3 = AccountActionTokenFactory.create(
+            action='unknown', created=now - dt.timedelta(days=3))
+        # Run & check
+        with django_assert_num_queries(1):
+            pending_pks = set(AccountActionToken.pending_objects.values_list('pk', flat=True))
+        assert pending_pks == {token_2.pk, token_3.pk}
+
+    def test_can_flag_the_expired_tokens(self):
+        # Setup
+        token_1 = AccountActionTokenFactory.create()
+        token_2 = AccountActionTokenFactory.create()
+        AccountActionToken.objects.filter(pk=token_2.pk).update(
+            expires_at=timezone.now() - dt.timedelta(days=1))
+        # Run
+        updated = AccountActionToken.objects.update_expired_statuses()
+        # Check
+        assert updated == 1
+        token_1.refresh_from_db()
+        token_2.refresh_from_db()
+        assert token_1.status == AccountActionToken.STATUS_PENDING
+        assert token_2.status == AccountActionToken.STATUS_EXPIRED
+
+
+@pytest.mark.django_db
+class TestAccountActionTokenPurge(object):
+    def _create_old_tokens(self, action='action', days=100):
+        user = User.objects.create_user(
+            username='test-{}'.format(action), password='not_secret', email='test@exampe.com')
+        dt_old = timezone.now() - dt.timedelta(days=days)
+        expired = AccountActionTokenFactory.create(action=action, created=dt_old)
+        canceled = AccountActionTokenFactory.create(action=action, is_canceled=True)
+        consumed = AccountActionTokenFactory.create(action=action)
+        consumed.consume(user)
+        AccountActionToken.objects.filter(pk=canceled.pk).update(updated=dt_old)
+        AccountActionToken.objects.filter(pk=consumed.pk).update(consumption_date=dt_old)
+        return [expired, canceled, consumed]
+
+    def test_can_return_the_tokens_that_can_be_purged(self):
+        # Setup
+        old_tokens = self._create_old_tokens()
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        AccountActionTokenFactory.create()
+        AccountActionTokenFactory.create(is_canceled=True)
+        AccountActionTokenFactory.create().consume(user)
+        ExpiredAccountActionTokenFactory.create()
+        # Run
+        tokens = AccountActionToken.objects.get_purgeable_queryset(retention_duration=30)
+        # Check
+        assert set(tokens) == set(old_tokens)
+
+    def test_can_use_per_action_retention_durations(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(
+            account_actions_settings, 'TOKEN_RETENTION_DURATIONS',
+            {'kept-forever': None, 'short-lived': 1})
+        self._create_old_tokens(action='kept-forever')
+        short_lived_tokens = self._create_old_tokens(action='short-lived', days=15)
+        self._create_old_tokens(action='default', days=15)
+        # Run
+        tokens = AccountActionToken.objects.get_purgeable_queryset(retention_duration=30)
+        # Check
+        assert set(tokens) == set(short_lived_tokens)
+
+    def test_can_purge_tokens_by_chunks(self):
+        # Setup
+        self._create_old_tokens()
+        pending_token = AccountActionTokenFactory.create()
+        counts = []
+        # Run
+        deleted = AccountActionToken.objects.purge(
+            retention_duration=30, chunk_size=2, callback=counts.append)
+        # Check
+        assert deleted == 3
+        assert counts == [2, 3, ]
+        assert list(AccountActionToken.objects.all()) == [pending_token, ]
+
+
 @pytest.mark.django_db
 class TestPendingManager(object):
     def test_can_return_the_pending_account_actions(self):
@@ -37,21 +441,42 @@ class TestPendingManager(object):
             username='test2', password='not_secret', email='test2@exampe.com')
         token_1 = AccountActionTokenFactory.create(content_object=user_1)
         token_2 = AccountActionTokenFactory.create(content_object=user_1)
-        token_2._meta.get_field('created').auto_now_add = False
         token_2.created = timezone.now() - dt.timedelta(days=100)
         token_2.save()
-        token_2._meta.get_field('created').auto_now_add = True
         AccountActionTokenFactory.create(content_object=user_2)
         token_4 = AccountActionTokenFactory.create(content_object=user_2)
-        token_4._meta.get_field('created').auto_now_add = False
         token_4.created = timezone.now() - dt.timedelta(days=100)
         token_4.save()
-        token_4._meta.get_field('created').auto_now_add = True
         # Run
         tokens = AccountActionToken.pending_objects.get_for_object(user_1)
         # Check
         assert list(tokens) == [token_1, ]
 
+    def test_can_return_the_pending_account_actions_of_many_objects(
+            self, django_assert_num_queries):
+        # Setup
+        users = [
+            User.objects.create_user(
+                username='test{}'.format(i), password='not_secret', email='test@exampe.com')
+            for i in range(3)]
+        site = Site.objects.get_current()
+        token_1 = AccountActionTokenFactory.create(content_object=users[0])
+        token_2 = AccountActionTokenFactory.create(content_object=users[0])
+        token_3 = AccountActionTokenFactory.create(content_object=site)
+        AccountActionTokenFactory.create(content_object=users[1], is_canceled=True)
+        ContentType.objects.clear_cache()
+        # Run & check
+        # One query to fetch the content types and one query per model
+        with django_assert_num_queries(3):
+            tokens = AccountActionToken.pending_objects.get_for_objects(users + [site, ])
+            assert tokens[users[0]][0].content_object == users[0]
+        assert tokens == {
+            users[0]: [token_1, token_2, ],
+            users[1]: [],
+            users[2]: [],
+            site: [token_3, ],
+        }
+
 
 @pytest.mark.django_db
 class TestConsumedManager(object):
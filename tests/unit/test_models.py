@@ -2,13 +2,18 @@
 
 import datetime as dt
 
+from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 import pytest
 
 from account_actions.action_base import AccountActionBase
 from account_actions.action_pool import actions
 from account_actions.conf import settings as account_actions_settings
+from account_actions.models import AccountActionExecution
+from account_actions.models import AccountActionToken
 from account_actions.test.factories import AccountActionTokenFactory
 
 
@@ -23,6 +28,35 @@ class TestSignalAction(AccountActionBase):
         test_signal += 1  # noqa
 
 
+class ShortLivedAction(AccountActionBase):
+    name = 'short-lived-action'
+    validity_duration = 1
+
+    def execute(self, method):  # pragma: no cover
+        pass
+
+
+class BackgroundAction(AccountActionBase):
+    name = 'background-action'
+    execution_mode = 'background'
+    failures = 0
+    executed_tokens = []
+
+    def execute(self, token):
+        if BackgroundAction.failures:
+            BackgroundAction.failures -= 1
+            raise ValueError('Unable to execute the action')
+        BackgroundAction.executed_tokens.append(token.pk)
+
+
+class WritingBackgroundAction(AccountActionBase):
+    name = 'writing-background-action'
+    execution_mode = 'background'
+
+    def execute(self, token):
+        Group.objects.create(name='execution-{}'.format(Group.objects.count()))
+
+
 @pytest.mark.django_db
 class TestAccountActionToken(object):
     @pytest.yield_fixture(autouse=True)
@@ -37,14 +71,71 @@ class TestAccountActionToken(object):
         assert token.expiration_date == (token.created + dt.timedelta(
             days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION))
 
+    def test_stores_its_expiration_date_on_creation(self):
+        # Setup
+        token = AccountActionTokenFactory.create()
+        # Run & check
+        token.refresh_from_db()
+        assert token.expires_at == (token.created + dt.timedelta(
+            days=account_actions_settings.ACTION_TOKEN_VALIDITY_DURATION))
+
+    def test_can_use_the_validity_duration_of_its_action(self):
+        # Setup
+        actions.register(ShortLivedAction)
+        token = AccountActionTokenFactory.create(action='short-lived-action')
+        # Run & check
+        assert token.expires_at == token.created + dt.timedelta(days=1)
+        token.created = timezone.now() - dt.timedelta(days=2)
+        token.save()
+        assert token.is_expired
+        assert AccountActionToken.objects.get(pk=token.pk).status == \
+            AccountActionToken.STATUS_EXPIRED
+
+    def test_keeps_its_status_in_sync(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create()
+        token_2 = AccountActionTokenFactory.create()
+        # Run
+        token_1.consume(user)
+        token_2.cancel()
+        # Check
+        assert AccountActionToken.objects.get(pk=token_1.pk).status == \
+            AccountActionToken.STATUS_CONSUMED
+        assert AccountActionToken.objects.get(pk=token_2.pk).status == \
+            AccountActionToken.STATUS_CANCELED
+
+    def test_can_compute_statuses_in_update_queries(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token_1 = AccountActionTokenFactory.create()
+        token_2 = AccountActionTokenFactory.create(
+            created=timezone.now() - dt.timedelta(days=100))
+        token_3 = AccountActionTokenFactory.create()
+        token_3.consume(user)
+        qs = AccountActionToken.objects.all()
+        # Run & check
+        qs.update(is_canceled=True, status=AccountActionToken.get_status_expression(True))
+        assert dict(qs.values_list('pk', 'status')) == {
+            token_1.pk: AccountActionToken.STATUS_CANCELED,
+            token_2.pk: AccountActionToken.STATUS_CANCELED,
+            token_3.pk: AccountActionToken.STATUS_CONSUMED,
+        }
+        qs.update(is_canceled=False, status=AccountActionToken.get_status_expression(False))
+        assert dict(qs.values_list('pk', 'status')) == {
+            token_1.pk: AccountActionToken.STATUS_PENDING,
+            token_2.pk: AccountActionToken.STATUS_EXPIRED,
+            token_3.pk: AccountActionToken.STATUS_CONSUMED,
+        }
+
     def test_can_indicate_if_it_is_expired(self):
         # Setup
         token_1 = AccountActionTokenFactory.create()
         token_2 = AccountActionTokenFactory.create()
-        token_2._meta.get_field('created').auto_now_add = False
         token_2.created = timezone.now() - dt.timedelta(days=100)
         token_2.save()
-        token_2._meta.get_field('created').auto_now_add = True
         # Run & check
         assert not token_1.is_expired
         assert token_2.is_expired
@@ -78,6 +169,83 @@ class TestAccountActionToken(object):
         token.consume(user)
         assert test_signal == 1
 
+    def test_does_not_trigger_the_consumption_signal_twice(self):
+        # Setup
+        global test_signal
+        test_signal = 0
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create(action='test-signal-action')
+        actions.register(TestSignalAction)
+        token.consume(user)
+        # Run
+        token.save()
+        token = AccountActionToken.objects.get(pk=token.pk)
+        token.save()
+        # Check
+        assert test_signal == 1
+
+    def test_triggers_the_consumption_signal_for_tokens_fetched_from_the_database(self):
+        # Setup
+        global test_signal
+        test_signal = 0
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionTokenFactory.create(action='test-signal-action')
+        actions.register(TestSignalAction)
+        token = AccountActionToken.objects.get(pk=token.pk)
+        # Run
+        token.user = user
+        token.consumption_date = timezone.now()
+        token.save()
+        # Check
+        assert test_signal == 1
+
+    def test_consumption_only_updates_the_changed_columns_in_a_single_query(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        token = AccountActionToken.objects.get(pk=AccountActionTokenFactory.create().pk)
+        # Run
+        with CaptureQueriesContext(connection) as context:
+            token.consume(user)
+        # Check
+        assert len(context.captured_queries) == 1
+        sql = context.captured_queries[0]['sql']
+        assert sql.startswith('UPDATE')
+        assert '"consumption_date"' in sql
+        assert '"email"' not in sql
+
+    def test_can_return_its_changed_fields(self):
+        # Setup
+        token = AccountActionTokenFactory.create()
+        # Run & check
+        assert token.get_changed_fields() == []
+        token.is_canceled = True
+        assert token.get_changed_fields() == ['is_canceled', ]
+        token.cancel()
+        assert token.get_changed_fields() == []
+        token.email = 'changed@example.com'
+        assert token.get_changed_fields() == ['email', ]
+
+    def test_can_only_save_its_changed_fields(self):
+        # Setup
+        token = AccountActionToken.objects.get(pk=AccountActionTokenFactory.create().pk)
+        AccountActionToken.objects.filter(pk=token.pk).update(action='concurrent-update')
+        token.email = 'changed@example.com'
+        # Run
+        with CaptureQueriesContext(connection) as context:
+            token.save(only_changed=True)
+        # Check
+        assert len(context.captured_queries) == 1
+        sql = context.captured_queries[0]['sql']
+        assert '"email"' in sql
+        assert '"action"' not in sql
+        token.refresh_from_db()
+        assert token.email == 'changed@example.com'
+        assert token.action == 'concurrent-update'
+        assert token.get_changed_fields() == []
+
     def test_knows_that_a_pending_token_can_be_consumed(self):
         # Setup
         token = AccountActionTokenFactory.create()
@@ -87,10 +255,8 @@ class TestAccountActionToken(object):
     def test_knows_that_an_expired_token_cannot_be_consumed(self):
         # Setup
         token = AccountActionTokenFactory.create()
-        token._meta.get_field('created').auto_now_add = False
         token.created = timezone.now() - dt.timedelta(days=100)
         token.save()
-        token._meta.get_field('created').auto_now_add = True
         # Run & check
         assert not token.can_be_consumed
 
@@ -108,3 +274,172 @@ class TestAccountActionToken(object):
         token = AccountActionTokenFactory.create(is_canceled=True)
         # Run & check
         assert not token.can_be_consumed
+
+
+@pytest.mark.django_db
+class TestAccountActionExecution(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        actions.register(BackgroundAction)
+        BackgroundAction.failures = 0
+        del BackgroundAction.executed_tokens[:]
+        self.user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        yield
+        actions.unregister_all()
+
+    def test_can_run_the_action_of_a_consumed_token(self):
+        # Setup
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        execution = AccountActionExecution.objects.get(token=token)
+        # Run
+        execution.run()
+        # Check
+        execution.refresh_from_db()
+        assert execution.status == AccountActionExecution.STATUS_DONE
+        assert execution.attempts == 1
+        assert BackgroundAction.executed_tokens == [token.pk, ]
+
+    def test_retries_failed_executions_with_a_backoff_delay(self):
+        # Setup
+        BackgroundAction.failures = 2
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        execution = AccountActionExecution.objects.get(token=token)
+        # Run
+        execution.run()
+        first_delay = execution.next_attempt_date - timezone.now()
+        execution.run()
+        second_delay = execution.next_attempt_date - timezone.now()
+        # Check
+        execution.refresh_from_db()
+        assert execution.status == AccountActionExecution.STATUS_PENDING
+        assert execution.attempts == 2
+        assert 'Unable to execute the action' in execution.last_error
+        assert dt.timedelta(seconds=50) < first_delay <= dt.timedelta(seconds=60)
+        assert dt.timedelta(seconds=110) < second_delay <= dt.timedelta(seconds=120)
+        assert not BackgroundAction.executed_tokens
+
+    def test_stops_retrying_after_the_maximum_number_of_attempts(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'EXECUTION_MAX_ATTEMPTS', 2)
+        BackgroundAction.failures = 2
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        execution = AccountActionExecution.objects.get(token=token)
+        # Run
+        execution.run()
+        execution.run()
+        # Check
+        assert execution.status == AccountActionExecution.STATUS_FAILED
+
+    def test_runs_each_due_execution_only_once(self):
+        # Setup
+        token_1 = AccountActionTokenFactory.create(action='background-action')
+        token_2 = AccountActionTokenFactory.create(action='background-action')
+        token_1.consume(self.user)
+        token_2.consume(self.user)
+        AccountActionExecution.objects.enqueue(token_1)
+        # Run
+        run_count_1 = AccountActionExecution.objects.run_due_executions()
+        run_count_2 = AccountActionExecution.objects.run_due_executions()
+        # Check
+        assert run_count_1 == 2
+        assert run_count_2 == 0
+        assert sorted(BackgroundAction.executed_tokens) == [token_1.pk, token_2.pk, ]
+
+    def test_claims_again_the_running_executions_whose_lease_has_expired(self):
+        # Setup
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        AccountActionExecution.objects.filter(token=token).update(
+            status=AccountActionExecution.STATUS_RUNNING, attempts=1,
+            next_attempt_date=timezone.now() - dt.timedelta(seconds=1))
+        # Run
+        run_count = AccountActionExecution.objects.run_due_executions()
+        # Check
+        execution = AccountActionExecution.objects.get(token=token)
+        assert run_count == 1
+        assert execution.status == AccountActionExecution.STATUS_DONE
+        assert execution.attempts == 3
+        assert BackgroundAction.executed_tokens == [token.pk, ]
+
+    def test_does_not_claim_the_running_executions_whose_lease_is_ongoing(self):
+        # Setup
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        AccountActionExecution.objects.filter(token=token).update(
+            status=AccountActionExecution.STATUS_RUNNING, attempts=1,
+            next_attempt_date=timezone.now() + dt.timedelta(seconds=60))
+        # Run
+        run_count = AccountActionExecution.objects.run_due_executions()
+        # Check
+        execution = AccountActionExecution.objects.get(token=token)
+        assert run_count == 0
+        assert execution.status == AccountActionExecution.STATUS_RUNNING
+        assert execution.attempts == 1
+        assert not BackgroundAction.executed_tokens
+
+    def test_fails_the_stale_executions_that_reached_the_maximum_number_of_attempts(
+            self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'EXECUTION_MAX_ATTEMPTS', 2)
+        token = AccountActionTokenFactory.create(action='background-action')
+        token.consume(self.user)
+        AccountActionExecution.objects.filter(token=token).update(
+            status=AccountActionExecution.STATUS_RUNNING, attempts=1,
+            next_attempt_date=timezone.now() - dt.timedelta(seconds=1))
+        # Run
+        run_count = AccountActionExecution.objects.run_due_executions()
+        # Check
+        execution = AccountActionExecution.objects.get(token=token)
+        assert run_count == 0
+        assert execution.status == AccountActionExecution.STATUS_FAILED
+        assert execution.attempts == 2
+        assert 'lease has expired' in execution.last_error
+        assert not BackgroundAction.executed_tokens
+
+    def test_discards_the_outcome_of_an_execution_that_was_claimed_again(self):
+        # Setup
+        actions.register(WritingBackgroundAction)
+        token = AccountActionTokenFactory.create(action='writing-background-action')
+        token.consume(self.user)
+        AccountActionExecution.objects.filter(token=token).update(
+            status=AccountActionExecution.STATUS_RUNNING,
+            next_attempt_date=timezone.now() - dt.timedelta(seconds=1))
+        # The first worker is slow: its lease expires before the end of the execution.
+        slow_execution = AccountActionExecution.objects.select_related('token').get(token=token)
+        AccountActionExecution.objects.run_due_executions()
+        # Run
+        slow_execution.run()
+        # Check
+        execution = AccountActionExecution.objects.get(token=token)
+        assert execution.status == AccountActionExecution.STATUS_DONE
+        assert execution.attempts == 2
+        assert Group.objects.count() == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='SQLite query plans')
+class TestAccountActionTokenIndexes(object):
+    def test_uses_an_index_to_filter_tokens_on_content_objects(self):
+        # Setup
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run
+        plan = AccountActionToken.objects.get_for_object(user).explain()
+        # Check
+        assert 'account_act_object_idx' in plan
+
+    def test_uses_an_index_to_filter_tokens_on_actions(self):
+        # Run
+        plan = AccountActionToken.objects.filter(action='action-1').order_by('created').explain()
+        # Check
+        assert 'account_act_action_idx' in plan
+
+    def test_uses_the_partial_index_to_list_the_pending_tokens(self):
+        # Run
+        plan = AccountActionToken.pending_objects.all().explain()
+        # Check
+        assert 'account_act_pending_exp_idx' in plan
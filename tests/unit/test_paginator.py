@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from account_actions.core.paginator import EstimatedCountPaginator
+from account_actions.models import AccountActionToken
+from account_actions.test.factories import AccountActionTokenFactory
+
+
+@pytest.mark.django_db
+class TestEstimatedCountPaginator(object):
+    def test_uses_the_estimated_count_of_large_tables(self, monkeypatch):
+        # Setup
+        AccountActionTokenFactory.create_batch(2)
+        paginator = EstimatedCountPaginator(AccountActionToken.objects.all(), 10)
+        monkeypatch.setattr(paginator, 'get_estimated_count', lambda: 50000)
+        # Run & check
+        assert paginator.count == 50000
+
+    def test_uses_an_exact_count_for_small_tables(self, monkeypatch):
+        # Setup
+        AccountActionTokenFactory.create_batch(2)
+        paginator = EstimatedCountPaginator(AccountActionToken.objects.all(), 10)
+        monkeypatch.setattr(paginator, 'get_estimated_count', lambda: 100)
+        # Run & check
+        assert paginator.count == 2
+
+    def test_does_not_estimate_the_count_of_filtered_querysets(self):
+        # Setup
+        AccountActionTokenFactory.create_batch(2)
+        paginator = EstimatedCountPaginator(
+            AccountActionToken.objects.filter(is_canceled=False), 10)
+        # Run & check
+        assert paginator.get_estimated_count() is None
+        assert paginator.count == 2
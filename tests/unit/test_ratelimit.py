@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+from django.core.cache import caches
+from django.test import RequestFactory
+import pytest
+
+from account_actions.conf import settings as account_actions_settings
+from account_actions.ratelimit import CacheRateLimiter
+from account_actions.ratelimit import NoRateLimiter
+from account_actions.ratelimit import get_rate_limiter
+
+
+class TestCacheRateLimiter(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        self.factory = RequestFactory()
+        caches['default'].clear()
+        yield
+        caches['default'].clear()
+
+    def test_limits_the_number_of_lookups_per_ip_address(self):
+        # Setup
+        rate_limiter = CacheRateLimiter(rate_per_ip=2, rate_per_key=None)
+        request = self.factory.get('/', REMOTE_ADDR='10.0.0.1')
+        other_request = self.factory.get('/', REMOTE_ADDR='10.0.0.2')
+        # Run & check
+        assert rate_limiter.is_allowed(request, 'key-1')
+        assert rate_limiter.is_allowed(request, 'key-2')
+        assert not rate_limiter.is_allowed(request, 'key-3')
+        assert rate_limiter.is_allowed(other_request, 'key-3')
+
+    def test_limits_the_number_of_lookups_per_key(self):
+        # Setup
+        rate_limiter = CacheRateLimiter(rate_per_ip=None, rate_per_key=2)
+        # Run & check
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            assert rate_limiter.is_allowed(self.factory.get('/', REMOTE_ADDR=ip), 'key-1')
+        assert not rate_limiter.is_allowed(self.factory.get('/', REMOTE_ADDR='10.0.0.3'), 'key-1')
+        assert rate_limiter.is_allowed(self.factory.get('/', REMOTE_ADDR='10.0.0.3'), 'key-2')
+
+    def test_can_use_the_client_address_of_a_proxy_header(self):
+        # Setup
+        rate_limiter = CacheRateLimiter(
+            rate_per_ip=1, rate_per_key=None, ip_meta_key='HTTP_X_FORWARDED_FOR')
+        request_1 = self.factory.get('/', HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.254')
+        request_2 = self.factory.get('/', HTTP_X_FORWARDED_FOR='10.0.0.2, 10.0.0.254')
+        # Run & check
+        assert rate_limiter.is_allowed(request_1, 'key-1')
+        assert rate_limiter.is_allowed(request_2, 'key-1')
+        assert not rate_limiter.is_allowed(request_1, 'key-1')
+
+
+class TestGetRateLimiter(object):
+    def test_does_not_limit_lookups_by_default(self):
+        # Run & check
+        assert isinstance(get_rate_limiter(), NoRateLimiter)
+
+    def test_can_use_the_configured_rate_limiter(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'RATE_LIMITER', 'cache')
+        monkeypatch.setattr(account_actions_settings, 'RATE_LIMITER_OPTIONS', {'rate_per_ip': 5})
+        # Run
+        rate_limiter = get_rate_limiter()
+        # Check
+        assert isinstance(rate_limiter, CacheRateLimiter)
+        assert rate_limiter.rate_per_ip == 5
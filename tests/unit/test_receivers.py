@@ -3,13 +3,21 @@
 from django.contrib.auth.models import User
 import pytest
 
+from account_actions import receivers
 from account_actions.action_base import AccountActionBase
 from account_actions.action_pool import actions
+from account_actions.conf import settings as account_actions_settings
+from account_actions.dispatchers import BaseDispatcher
+from account_actions.models import AccountActionExecution
+from account_actions.models import AccountActionToken
+from account_actions.signals import action_token_consumed
+from account_actions.signals import action_tokens_consumed
 from account_actions.test.factories import AccountActionTokenFactory
 
 
 email_sent = False
 execute_called = False
+executed_tokens = []
 
 
 class TestEmailNotificationAction(AccountActionBase):
@@ -34,6 +42,30 @@ class TestExecuteAction(AccountActionBase):
         execute_called = True
 
 
+class TestOnCommitExecuteAction(AccountActionBase):
+    name = 'test-on-commit-execute'
+    execution_mode = 'on_commit'
+
+    def execute(self, token):
+        executed_tokens.append(token)
+
+
+class TestBackgroundExecuteAction(AccountActionBase):
+    name = 'test-background-execute'
+    execution_mode = 'background'
+
+    def execute(self, token):
+        executed_tokens.append(token)
+
+
+class RecordingDispatcher(BaseDispatcher):
+    def __init__(self):
+        self.calls = []
+
+    def dispatch(self, func, *args, **kwargs):  # pragma: no cover
+        self.calls.append(func)
+
+
 @pytest.mark.django_db
 class TestSendCreationNotificationEmailReceiver(object):
     @pytest.yield_fixture(autouse=True)
@@ -41,6 +73,17 @@ class TestSendCreationNotificationEmailReceiver(object):
         yield
         actions.unregister_all()
 
+    def test_does_not_dispatch_notifications_for_actions_without_notification_hooks(
+            self, monkeypatch):
+        # Setup
+        actions.register(TestOnCommitExecuteAction)
+        dispatcher = RecordingDispatcher()
+        monkeypatch.setattr(receivers, 'get_notification_dispatcher', lambda: dispatcher)
+        # Run
+        AccountActionTokenFactory.create(action='test-on-commit-execute')
+        # Check
+        assert not dispatcher.calls
+
     def test_can_send_a_notification_on_token_creation(self):
         # Setup
         actions.register(TestEmailNotificationAction)
@@ -65,3 +108,81 @@ class TestExecuteActionReceiver(object):
         # Run & check
         token.consume(user)
         assert execute_called
+
+    def test_can_execute_the_action_once_the_transaction_is_committed(
+            self, django_capture_on_commit_callbacks):
+        # Setup
+        del executed_tokens[:]
+        actions.register(TestOnCommitExecuteAction)
+        token = AccountActionTokenFactory.create(action='test-on-commit-execute')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run & check
+        with django_capture_on_commit_callbacks(execute=True):
+            token.consume(user)
+            assert not executed_tokens
+        assert executed_tokens == [token, ]
+
+    def test_can_schedule_the_execution_of_the_action_in_the_background(self):
+        # Setup
+        del executed_tokens[:]
+        actions.register(TestBackgroundExecuteAction)
+        token = AccountActionTokenFactory.create(action='test-background-execute')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run
+        token.consume(user)
+        # Check
+        assert not executed_tokens
+        execution = AccountActionExecution.objects.get()
+        assert execution.token == token
+        assert execution.status == AccountActionExecution.STATUS_PENDING
+
+
+@pytest.mark.django_db
+class TestBatchedConsumptionReceivers(object):
+    @pytest.yield_fixture(autouse=True)
+    def setup(self):
+        del executed_tokens[:]
+        self.received = []
+        action_token_consumed.connect(self._receive_token)
+        action_tokens_consumed.connect(self._receive_tokens)
+        yield
+        action_token_consumed.disconnect(self._receive_token)
+        action_tokens_consumed.disconnect(self._receive_tokens)
+        actions.unregister_all()
+
+    def _receive_token(self, sender, instance, consumer, **kwargs):
+        self.received.append(('token', instance.key, kwargs.get('batched', False)))
+
+    def _receive_tokens(self, sender, instances, consumer, **kwargs):
+        self.received.append(('tokens', [instance.key for instance in instances]))
+
+    def test_sends_a_single_signal_for_many_consumed_tokens(self):
+        # Setup
+        actions.register(TestBackgroundExecuteAction)
+        tokens = AccountActionTokenFactory.create_batch(2, action='test-background-execute')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run
+        AccountActionToken.objects.consume_many([token.key for token in tokens], user)
+        # Check
+        assert len(self.received) == 3
+        assert ('tokens', [token.key for token in tokens]) in self.received
+        assert ('token', tokens[0].key, True) in self.received
+        assert ('token', tokens[1].key, True) in self.received
+        # The actions are executed only once
+        assert AccountActionExecution.objects.count() == 2
+
+    def test_can_disable_the_per_token_signal_for_bulk_operations(self, monkeypatch):
+        # Setup
+        monkeypatch.setattr(account_actions_settings, 'FAN_OUT_CONSUMED_SIGNAL', False)
+        actions.register(TestBackgroundExecuteAction)
+        tokens = AccountActionTokenFactory.create_batch(2, action='test-background-execute')
+        user = User.objects.create_user(
+            username='test', password='not_secret', email='test@exampe.com')
+        # Run
+        AccountActionToken.objects.consume_many([token.key for token in tokens], user)
+        # Check
+        assert self.received == [('tokens', [token.key for token in tokens]), ]
+        assert AccountActionExecution.objects.count() == 2